@@ -1,154 +1,2455 @@
+import itertools
+import asyncio
+import base64
+import bisect
+import contextlib
+import contextvars
+import functools
+import gzip
+import hashlib
+import io
+import json
 import logging
+import multiprocessing
+import queue
+import re
+import shutil
+import sqlite3
+import sys
+import textwrap
 import subprocess
+import threading
 import time
-from flask import Flask, request, send_file, jsonify, after_this_request, render_template_string
+import urllib.error
+import uuid
+import zipfile
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from flask import Flask, Request, Response, request, send_file, jsonify, stream_with_context
+from markupsafe import escape
+from werkzeug.exceptions import RequestEntityTooLarge
+from werkzeug.wsgi import ClosingIterator
 from PyPDF2 import PdfReader
-from PyPDF2.errors import PdfReadError
-from libretranslatepy import LibreTranslateAPI
-from gtts import gTTS
+from gtts import gTTS, gTTSError
 import speech_recognition as sr
+from speech_recognition.recognizers import google as sr_google
 from pydub import AudioSegment
+from pydub.utils import audioop
 import tempfile
 import os
 import requests
+from pdf_extract import (MAX_FILE_SIZE, MAX_TEXT_LENGTH, check_file_size, extract_pdf_pages_path, extract_pdf_path,
+                         iter_pdf_text, limit_text, open_pdf)
+
+try:
+    import brotli
+except ImportError:  # optional; the index page is still served gzip-compressed
+    brotli = None
+try:
+    import aiohttp
+    from aiohttp import web
+except ImportError:  # optional; only the async pipeline mode needs it
+    aiohttp = web = None
+try:
+    import fcntl
+except ImportError:  # not on Windows; duplicates are then only coalesced within a process
+    fcntl = None
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 
 app = Flask(__name__)
 
-# Constants
-MAX_FILE_SIZE = 10 * 1024 * 1024  # 10MB
-MAX_TEXT_LENGTH = 1000  # Limited to 1000 chars
-VALID_STT_LANGS = []  # Will be populated dynamically
+# Run as `python app.py`, this file is re-imported as __mp_main__ by the extract pool's
+# spawned workers. They only call into pdf_extract, so they skip the background work.
+POOL_WORKER = __name__ == '__mp_main__'
 
-# Initialize LibreTranslate API (public server)
-lt = LibreTranslateAPI("https://libretranslate.com/")
+# Constants
+UPLOAD_SPOOL_BYTES = 1024 * 1024  # Uploads larger than this spill from memory to a temp file
+SCRATCH_RAM_DIR = os.getenv('SCRATCH_RAM_DIR', '/dev/shm')  # tmpfs for intermediate files; unused if it doesn't exist
+SCRATCH_RAM_BYTES = int(os.getenv('SCRATCH_RAM_BYTES', 128 * 1024 * 1024))  # 128MB of intermediates per process on tmpfs before spilling to disk
+SCRATCH_DISK_DIR = os.getenv('SCRATCH_DISK_DIR', os.path.join(tempfile.gettempdir(), 'pdf-ai-scratch'))
+SCRATCH_MAX_AGE = int(os.getenv('SCRATCH_MAX_AGE', 6 * 3600))  # Seconds before the janitor removes an orphaned scratch file
+SCRATCH_JANITOR_INTERVAL = 60  # Seconds between janitor sweeps
+STT_SAMPLE_RATE = 16000  # Speech recognition input: 16 kHz mono 16-bit PCM
+STT_FRAME_MS = 30  # Energy analysis frame for silence detection
+STT_SEGMENT_MIN_SECONDS = int(os.getenv('STT_SEGMENT_MIN_SECONDS', 10))
+STT_SEGMENT_MAX_SECONDS = int(os.getenv('STT_SEGMENT_MAX_SECONDS', 50))  # Google's free endpoint struggles past ~60 s
+STT_DECODE_TIMEOUT = int(os.getenv('STT_DECODE_TIMEOUT', 300))  # Seconds ffmpeg may take to decode an upload
+STT_CONCURRENCY = int(os.getenv('STT_CONCURRENCY', 32))  # Recognition threads per process; the adaptive limit runs below this
+TRANSLATE_CHUNK_CHARS = int(os.getenv('TRANSLATE_CHUNK_CHARS', 2000))  # Max characters per upstream translate call
+TRANSLATE_CONCURRENCY = int(os.getenv('TRANSLATE_CONCURRENCY', 32))  # Translate threads per process; the adaptive limit runs below this
+TRANSLATE_TIMEOUT = int(os.getenv('TRANSLATE_TIMEOUT', 60))  # Seconds per upstream translate call
+TTS_SEGMENT_CHARS = int(os.getenv('TTS_SEGMENT_CHARS', 500))  # Max characters per synthesized segment
+TTS_CACHE_PATH = os.getenv('TTS_CACHE_PATH', os.path.join(tempfile.gettempdir(), 'pdf-ai-tts.sqlite3'))
+TTS_CACHE_MAX_BYTES = int(os.getenv('TTS_CACHE_MAX_BYTES', 256 * 1024 * 1024))  # 256MB
+TTS_CACHE_TOUCH_INTERVAL = 300  # Seconds before a cache hit re-records a segment's last use
+TTS_CONCURRENCY = int(os.getenv('TTS_CONCURRENCY', 32))  # TTS threads per process; the adaptive limit runs below this
+TTS_TIMEOUT = int(os.getenv('TTS_TIMEOUT', 30))  # Seconds per TTS upstream request
+TTS_ENDPOINT = os.getenv('TTS_ENDPOINT')  # Overrides gTTS's batchexecute URL, e.g. for a local stand-in
+MP3_LOW_BITRATE = os.getenv('MP3_LOW_BITRATE', '16k')  # format=mp3-low: mono 16 kHz MP3 at this bitrate
+OPUS_BITRATE = os.getenv('OPUS_BITRATE', '12k')  # format=opus: mono Opus in Ogg at this bitrate
+STT_ENDPOINT = os.getenv('STT_ENDPOINT', 'http://www.google.com/speech-api/v2/recognize')
+STT_TIMEOUT = int(os.getenv('STT_TIMEOUT', 60))  # Seconds per speech recognition request
+UPSTREAM_MAX_BACKLOG = float(os.getenv('UPSTREAM_MAX_BACKLOG', 20))  # Seconds of queued upstream work before new requests get 429
+UPSTREAM_LATENCY_TOLERANCE = float(os.getenv('UPSTREAM_LATENCY_TOLERANCE', 2.5))  # Latency over baseline that counts as congestion
+UPSTREAM_INITIAL_CONCURRENCY = int(os.getenv('UPSTREAM_INITIAL_CONCURRENCY', 8))  # Adaptive limit each upstream starts at
+TRANSLATE_BACKEND = os.getenv('TRANSLATE_BACKEND', 'libretranslate')  # libretranslate, google-v2 or google-v3
+LIBRETRANSLATE_URL = os.getenv('LIBRETRANSLATE_URL', 'https://libretranslate.com/')  # Public server by default
+LIBRETRANSLATE_API_KEY = os.getenv('LIBRETRANSLATE_API_KEY')
+GOOGLE_CLOUD_PROJECT = os.getenv('GOOGLE_CLOUD_PROJECT')  # Required by google-v3
+LANGUAGES_CACHE_FILE = os.getenv('LANGUAGES_CACHE_FILE', os.path.join(tempfile.gettempdir(), 'pdf-ai-languages.json'))
+LANGUAGES_TTL = int(os.getenv('LANGUAGES_TTL', 24 * 3600))  # Seconds before the language list is refetched
+INDEX_MAX_AGE = int(os.getenv('INDEX_MAX_AGE', 300))  # Seconds browsers may reuse the index page before revalidating
+LANGUAGES_RETRY = 300  # Seconds between attempts while the language list can't be fetched
+JOB_WORKERS = int(os.getenv('JOB_WORKERS', 4))  # Background pipeline workers per process
+BATCH_MAX_BYTES = int(os.getenv('BATCH_MAX_BYTES', 200 * 1024 * 1024))  # 200MB per batch request
+BATCH_MAX_FILES = int(os.getenv('BATCH_MAX_FILES', 200))  # Documents per batch request
+BATCH_CONCURRENCY = int(os.getenv('BATCH_CONCURRENCY', 8))  # Batch documents in flight per process
+CPU_WORKERS = int(os.getenv('CPU_WORKERS', os.cpu_count() or 1))  # Processes for PDF parsing, and concurrent ffmpeg decodes
+CPU_QUEUE_DEPTH = int(os.getenv('CPU_QUEUE_DEPTH', 32))  # Queued CPU-stage tasks per pool before new requests get 429
+STREAM_QUEUE_DEPTH = int(os.getenv('STREAM_QUEUE_DEPTH', 4))  # Segments buffered between the stages of a streamed pipeline
+AIO_UPSTREAM_CONCURRENCY = int(os.getenv('AIO_UPSTREAM_CONCURRENCY', 64))  # Async mode: concurrent calls per upstream
+AIO_UPSTREAM_CONNECTIONS = int(os.getenv('AIO_UPSTREAM_CONNECTIONS', 200))  # Async mode: pooled connections in total
+JOB_TTL = int(os.getenv('JOB_TTL', 3600))  # Seconds a job and its result are kept
+JOBS_DIR = os.getenv('JOBS_DIR', os.path.join(tempfile.gettempdir(), 'pdf-ai-jobs'))
+DOCUMENT_TTL = int(os.getenv('DOCUMENT_TTL', 3600))  # Seconds an unused document session is kept
+DOCUMENTS_DIR = os.getenv('DOCUMENTS_DIR', os.path.join(tempfile.gettempdir(), 'pdf-ai-documents'))
+DETECT_SAMPLE_CHARS = 1000  # Text sent upstream to detect a document's language
+RESULT_CACHE_DIR = os.getenv('RESULT_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'pdf-ai-results'))
+RESULT_CACHE_MAX_BYTES = int(os.getenv('RESULT_CACHE_MAX_BYTES', 512 * 1024 * 1024))  # 512MB
+RESULT_MAX_AGE = int(os.getenv('RESULT_MAX_AGE', 365 * 24 * 3600))  # Seconds browsers may keep an MP3 from /results/
+TRANSLATION_MEMORY_PATH = os.getenv('TRANSLATION_MEMORY_PATH', os.path.join(tempfile.gettempdir(), 'pdf-ai-tm.sqlite3'))
+app.config['MAX_CONTENT_LENGTH'] = MAX_FILE_SIZE + 64 * 1024  # one file plus multipart overhead
+for _dir in (JOBS_DIR, DOCUMENTS_DIR, RESULT_CACHE_DIR):
+    os.makedirs(_dir, exist_ok=True)
 
-# Fetch supported languages from LibreTranslate
-try:
-    languages = requests.get("https://libretranslate.com/languages").json()
-    VALID_STT_LANGS = [lang['code'] for lang in languages]
-    logging.info(f"Loaded {len(VALID_STT_LANGS)} STT languages: {VALID_STT_LANGS}")
-except Exception as e:
-    logging.error(f"Failed to fetch languages: {e}")
-    VALID_STT_LANGS = ['en', 'fr', 'es', 'de']  # Fallback if API fails
+# Fallback until the language registry has loaded a real list
+languages = [{'code': 'en', 'name': 'English'}, {'code': 'fr', 'name': 'French'},
+             {'code': 'es', 'name': 'Spanish'}, {'code': 'de', 'name': 'German'}]
+VALID_STT_LANGS = [lang['code'] for lang in languages]
 
 def validate_stt_lang(lang: str) -> str:
     if lang not in VALID_STT_LANGS:
         raise ValueError(f"Invalid STT language code: {lang}")
     return lang
 
+def validate_translate_langs(source: str, target: str):
+    for lang in (source, target):
+        if lang not in VALID_STT_LANGS:
+            raise ValueError(f"Invalid translation language code: {lang}")
+
+# ---------------- Metrics ----------------
+# In-process counters, gauges and histograms, served at /metrics in Prometheus
+# text format. Each gunicorn worker keeps its own, so scrape every worker (or sum
+# across them) for a service-wide view. Timers use time.perf_counter and a lock
+# held only for a dict update, so they stay on in production.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+METRICS = {
+    'pdfai_request_seconds': ('histogram', 'Request latency by route, method and status.'),
+    'pdfai_requests_in_flight': ('gauge', 'Requests currently being handled, by route.'),
+    'pdfai_request_bytes_total': ('counter', 'Request body bytes received, by route.'),
+    'pdfai_response_bytes_total': ('counter', 'Response body bytes sent, by route.'),
+    'pdfai_stage_seconds': ('histogram', 'Time spent in each pipeline stage.'),
+    'pdfai_upstream_seconds': ('histogram', 'Latency of upstream calls (translate, tts, stt).'),
+    'pdfai_upstream_requests_total': ('counter', 'Upstream calls made.'),
+    'pdfai_upstream_errors_total': ('counter', 'Upstream calls that raised.'),
+    'pdfai_upstream_in_flight': ('gauge', 'Upstream calls currently in flight.'),
+    'pdfai_result_cache_requests_total': ('counter', 'Result cache lookups by outcome.'),
+    'pdfai_coalesced_requests_total': ('counter', 'Requests that shared an identical in-flight pipeline run.'),
+    'pdfai_upstream_concurrency_limit': ('gauge', 'Adaptive limit on concurrent calls, by upstream.'),
+    'pdfai_shed_requests_total': ('counter', 'Requests refused with 429 because an upstream or CPU pool was backlogged.'),
+    'pdfai_stage_pool_tasks': ('gauge', 'Tasks queued or running in each CPU stage pool.'),
+    'pdfai_translation_memory_segments_total': ('counter', 'Translation memory sentence lookups by outcome.'),
+    'pdfai_tts_cache_segments_total': ('counter', 'TTS segment cache lookups by outcome.'),
+    'pdfai_scratch_bytes': ('gauge', 'Bytes in live scratch files, by medium (ram or disk).'),
+    'pdfai_scratch_files': ('gauge', 'Live scratch files, by medium.'),
+    'pdfai_scratch_files_total': ('counter', 'Scratch files created, by the medium they started on.'),
+    'pdfai_scratch_spills_total': ('counter', 'Scratch files moved from tmpfs to disk for lack of room.'),
+    'pdfai_scratch_reaped_files_total': ('counter', 'Orphaned scratch files removed by the janitor.'),
+}
+metrics_lock = threading.Lock()
+metric_values = {}  # (name, labels) -> number, or [bucket counts..., +Inf count, sum] for histograms
+
+def _metric_key(name: str, labels: dict) -> tuple:
+    return name, tuple(sorted(labels.items()))
+
+def inc(name: str, amount: float = 1, **labels):
+    key = _metric_key(name, labels)
+    with metrics_lock:
+        metric_values[key] = metric_values.get(key, 0) + amount
+
+def set_gauge(name: str, value: float, **labels):
+    key = _metric_key(name, labels)
+    with metrics_lock:
+        metric_values[key] = value
+
+def observe(name: str, value: float, **labels):
+    key = _metric_key(name, labels)
+    with metrics_lock:
+        histogram = metric_values.get(key)
+        if histogram is None:
+            histogram = metric_values[key] = [0] * (len(LATENCY_BUCKETS) + 1) + [0.0]
+        histogram[bisect.bisect_left(LATENCY_BUCKETS, value)] += 1
+        histogram[-1] += value
+
+@contextlib.contextmanager
+def measure_stage(stage: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe('pdfai_stage_seconds', time.perf_counter() - start, stage=stage)
+
+@contextlib.contextmanager
+def measure_upstream(upstream: str):
+    inc('pdfai_upstream_in_flight', upstream=upstream)
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        inc('pdfai_upstream_errors_total', upstream=upstream)
+        raise
+    finally:
+        observe('pdfai_upstream_seconds', time.perf_counter() - start, upstream=upstream)
+        inc('pdfai_upstream_requests_total', upstream=upstream)
+        inc('pdfai_upstream_in_flight', -1, upstream=upstream)
+
+def _measured(measure, *measure_args):
+    # Wraps plain functions and coroutine functions alike (the latter for async mode).
+    def decorator(fn):
+        if asyncio.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with measure(*measure_args):
+                    return await fn(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with measure(*measure_args):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def timed_stage(stage: str):
+    return _measured(measure_stage, stage)
+
+def upstream_call(upstream: str):
+    return _measured(measure_upstream, upstream)
+
+def _escape_label(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_labels(labels: tuple) -> str:
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape_label(v)}"' for k, v in labels) + '}'
+
+def render_metrics() -> str:
+    with metrics_lock:
+        snapshot = {key: list(value) if isinstance(value, list) else value for key, value in metric_values.items()}
+    lines = []
+    for name, (kind, help_text) in METRICS.items():
+        series = sorted((labels, value) for (n, labels), value in snapshot.items() if n == name)
+        lines += [f'# HELP {name} {help_text}', f'# TYPE {name} {kind}']
+        for labels, value in series:
+            if kind != 'histogram':
+                lines.append(f'{name}{_format_labels(labels)} {value}')
+                continue
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS + ('+Inf',), value[:-1]):
+                cumulative += count
+                lines.append(f'{name}_bucket{_format_labels(labels + (("le", bound),))} {cumulative}')
+            lines.append(f'{name}_sum{_format_labels(labels)} {value[-1]}')
+            lines.append(f'{name}_count{_format_labels(labels)} {cumulative}')
+    return '\n'.join(lines) + '\n'
+
+# ---------------- Adaptive concurrency ----------------
+# Each upstream gets a large I/O thread pool (its *_CONCURRENCY; the threads only
+# wait on the network) and an AIMD limit on how many of them may be in a call at
+# once, between 1 and the pool size, starting at UPSTREAM_INITIAL_CONCURRENCY. The
+# limit, not the pool, is what holds a struggling upstream back. A call that
+# finishes within UPSTREAM_LATENCY_TOLERANCE times the upstream's baseline
+# latency raises the limit by about one per window of calls.
+# A slower call, or one that times out, can't connect or gets a 5xx or 429, halves
+# it, at most once per round trip. Calls the upstream rejects as invalid (a 4xx, an
+# unsupported language) free their slot without moving the limit, so one client's
+# bad input can't throttle everyone else. New requests are shed with 429 once the
+# queued work would take more than UPSTREAM_MAX_BACKLOG seconds to clear, so a slow
+# upstream can't pile every worker up behind it.
+class Overloaded(Exception):
+    def __init__(self, upstream: str, retry_after: int):
+        super().__init__(f"The {upstream} service is busy, please retry in {retry_after} s.")
+        self.upstream = upstream
+        self.retry_after = retry_after
+
+class UpstreamError(ValueError):
+    """An upstream answered with an error status; still a 400 to our client, like other ValueErrors."""
+
+    def __init__(self, message: str, status: int):
+        super().__init__(message)
+        self.status = status
+
+def is_congestion(error: BaseException) -> bool:
+    """Whether a failed upstream call points at an overloaded upstream rather than at the request."""
+    while error is not None:
+        response = error.rsp if isinstance(error, gTTSError) else getattr(error, 'response', None)
+        status = getattr(error, 'status', None) or getattr(response, 'status_code', None) or getattr(error, 'code', None)
+        if isinstance(status, int):
+            return status >= 500 or status == 429
+        if isinstance(error, (TimeoutError, ConnectionError, asyncio.TimeoutError, requests.Timeout,
+                              requests.ConnectionError, urllib.error.URLError)):
+            return True
+        error = error.__cause__ or error.__context__  # e.g. the HTTPError behind sr.RequestError
+    return False
+
+class AdaptiveLimiter:
+    def __init__(self, name: str, max_limit: int, initial: int = None):
+        self.name = name
+        self.max_limit = max_limit
+        self.limit = float(min(initial or max_limit, max_limit))
+        self.in_flight = 0
+        self.queued = 0
+        self.baseline = None  # tracks the fast end of observed latencies
+        self.latency = 0.0  # moving average, for backlog estimates
+        self.last_decrease = 0.0
+        self.cond = threading.Condition()
+        set_gauge('pdfai_upstream_concurrency_limit', int(self.limit), upstream=name)
+
+    def backlog_seconds(self) -> float:
+        with self.cond:
+            return (self.queued + self.in_flight) / int(self.limit) * self.latency
+
+    def admit(self):
+        """Raise Overloaded if a new request would wait too long for this upstream."""
+        backlog = self.backlog_seconds()
+        if backlog > UPSTREAM_MAX_BACKLOG:
+            inc('pdfai_shed_requests_total', upstream=self.name)
+            raise Overloaded(self.name, max(1, int(backlog - UPSTREAM_MAX_BACKLOG + 0.999)))
+
+    def submit(self, executor, fn, *args):
+        with self.cond:
+            self.queued += 1
+        future = executor.submit(self._run, fn, *args)
+        future.add_done_callback(self._cancelled)
+        return future
+
+    def _cancelled(self, future):
+        if future.cancelled():
+            with self.cond:
+                self.queued -= 1
+
+    def _run(self, fn, *args):
+        with self.cond:
+            while self.in_flight >= int(self.limit):
+                self.cond.wait()
+            self.queued -= 1
+            self.in_flight += 1
+        start, outcome = time.perf_counter(), 'ok'
+        try:
+            return fn(*args)
+        except Exception as e:
+            outcome = 'congested' if is_congestion(e) else 'rejected'
+            raise
+        finally:
+            self._release(time.perf_counter() - start, outcome)
+
+    def _release(self, latency: float, outcome: str):
+        with self.cond:
+            self.in_flight -= 1
+            if outcome != 'rejected':  # a refused request says nothing about the upstream's load
+                self._adjust(latency, outcome == 'ok')
+            self.cond.notify_all()
+            limit = int(self.limit)
+        set_gauge('pdfai_upstream_concurrency_limit', limit, upstream=self.name)
+
+    def _adjust(self, latency: float, ok: bool):
+        self.latency = latency if not self.latency else 0.8 * self.latency + 0.2 * latency
+        if ok:
+            if self.baseline is None or latency < self.baseline:
+                self.baseline = latency
+            else:
+                self.baseline += 0.05 * (latency - self.baseline)
+        now = time.monotonic()
+        if not ok or latency > UPSTREAM_LATENCY_TOLERANCE * self.baseline:
+            if now - self.last_decrease > latency:
+                self.limit = max(1.0, self.limit / 2)
+                self.last_decrease = now
+        else:
+            self.limit = min(float(self.max_limit), self.limit + 1 / self.limit)
+
+UPSTREAM_LIMITERS = {}
+
+def upstream_limiter(name: str, max_limit: int) -> AdaptiveLimiter:
+    limiter = UPSTREAM_LIMITERS[name] = AdaptiveLimiter(name, max_limit, UPSTREAM_INITIAL_CONCURRENCY)
+    return limiter
+
+def admit_stages(stages: list, limiters: dict = None):
+    """Shed a request up front if any upstream its pipeline stages call is backlogged."""
+    limiters = UPSTREAM_LIMITERS if limiters is None else limiters
+    for stage in stages:
+        if stage in limiters:
+            limiters[stage].admit()
+
 # ---------------- Helpers ----------------
-def check_file_size(file):
-    file.seek(0, os.SEEK_END)
-    size = file.tell()
-    file.seek(0)
-    if size > MAX_FILE_SIZE:
-        raise ValueError(f"File size exceeds {MAX_FILE_SIZE / 1024 / 1024}MB limit")
-    return file
-
-def limit_text(text: str) -> str:
-    if len(text) > MAX_TEXT_LENGTH:
-        return text[:MAX_TEXT_LENGTH] + "... [truncated]"
-    return text
+class UploadBuffer(tempfile.SpooledTemporaryFile):
+    """Upload spool that hashes and counts bytes as they arrive, so an oversized
+    file is rejected mid-stream and the content hash is ready when parsing ends."""
+
+    def __init__(self, limit: int = MAX_FILE_SIZE):
+        super().__init__(max_size=UPLOAD_SPOOL_BYTES, mode='w+b')
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+        self.limit = limit
+
+    def write(self, data):
+        self.size += len(data)
+        if self.size > self.limit:
+            raise RequestEntityTooLarge(f"File size exceeds {self.limit / 1024 / 1024}MB limit")
+        self.sha256.update(data)
+        return super().write(data)
+
+class UploadRequest(Request):
+    max_file_size = MAX_FILE_SIZE  # raised per request for batch uploads
 
-def extract_text_from_pdf(file_storage) -> str:
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return UploadBuffer(self.max_file_size)
+
+app.request_class = UploadRequest
+
+def spool_upload(file_storage):
+    # Werkzeug closes request files once the view returns, so anything that outlives
+    # the view (jobs, streamed responses) takes the upload's buffer over instead.
+    if isinstance(file_storage.stream, UploadBuffer):
+        buffer, file_storage.stream = file_storage.stream, io.BytesIO()
+    else:
+        buffer = tempfile.SpooledTemporaryFile(max_size=UPLOAD_SPOOL_BYTES)
+        file_storage.save(buffer)
+    buffer.seek(0)
+    return buffer
+
+def _write_json_atomic(path: str, data: dict):
+    # A unique temp file per write: thread idents repeat across forked workers.
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or '.', prefix=f"{os.path.basename(path)}.", suffix='.tmp')
     try:
-        check_file_size(file_storage)
-        reader = PdfReader(file_storage)
-    except PdfReadError:
-        raise ValueError("Invalid or corrupted PDF file. Please try another file.")
+        with os.fdopen(fd, 'w') as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+# ---------------- Scratch space ----------------
+# Intermediate files (synthesized MP3s before they enter the result cache, PDFs
+# handed to the extract pool, batch members) are written to tmpfs while this
+# process has less than SCRATCH_RAM_BYTES there, and move themselves to disk once
+# the budget or the tmpfs runs out. Files made inside scratch.scope() (each request,
+# job and batch document runs in one) are deleted when it exits, however it exits.
+# A janitor thread removes files orphaned by crashed workers and publishes usage.
+_scratch_scope = contextvars.ContextVar('scratch_scope', default=None)
+
+class ScratchFile:
+    """A named temp file that starts on tmpfs when there is room and moves to disk when there isn't."""
 
-    if reader.is_encrypted:
+    def __init__(self, space, suffix: str, medium: str):
+        self.space = space
+        self.suffix = suffix
+        self.medium = medium
+        self.size = 0
+        self.file = tempfile.NamedTemporaryFile(delete=False, suffix=suffix, dir=space.dirs[medium])
+        self.name = self.file.name
+
+    def write(self, data) -> int:
+        if not self.space.grow(self, len(data)):
+            self.spill()
+            self.space.grow(self, len(data))
+        return self.file.write(data)
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+    def spill(self):
+        disk = tempfile.NamedTemporaryFile(delete=False, suffix=self.suffix, dir=self.space.dirs['disk'])
+        self.file.flush()
+        self.file.seek(0)
+        shutil.copyfileobj(self.file, disk, 1024 * 1024)
+        self.file.close()
+        os.remove(self.name)
+        old_name, self.file, self.name = self.name, disk, disk.name
+        self.space.moved(self, old_name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.space.release(self.name, self)
+
+class ScratchSpace:
+    TMPFS_HEADROOM = 16 * 1024 * 1024  # left free for other processes sharing the tmpfs
+
+    def __init__(self, ram_dir: str, disk_dir: str, ram_bytes: int):
+        self.dirs = {'ram': ram_dir, 'disk': disk_dir}
+        self.ram_bytes = ram_bytes if ram_dir else 0
+        self.files = {}  # path -> ScratchFile, for files this process hasn't released
+        self.used = {'ram': 0, 'disk': 0}
+        self.lock = threading.Lock()
+        for directory in filter(None, self.dirs.values()):
+            os.makedirs(directory, exist_ok=True)
+
+    def file(self, suffix: str = '') -> ScratchFile:
+        """A new scratch file, deleted when the enclosing scope() exits or on release()."""
+        with self.lock:
+            medium = 'ram' if self.used['ram'] < self.ram_bytes else 'disk'
+        f = ScratchFile(self, suffix, medium)
+        with self.lock:
+            self.files[f.name] = f
+        scope = _scratch_scope.get()
+        if scope is not None:
+            scope.append(f)
+        inc('pdfai_scratch_files_total', medium=medium)
+        self._publish()
+        return f
+
+    def _tmpfs_has_room(self, n: int) -> bool:
         try:
-            reader.decrypt("")
-        except Exception:
-            raise ValueError("This PDF is password protected and cannot be processed.")
-
-    text = []
-    for page in reader.pages:
-        extracted = page.extract_text()
-        if extracted:
-            text.append(extracted)
-    result = "\n".join(text).strip()
-    if not result:
-        raise ValueError("No readable text found in the PDF.")
-    return limit_text(result)
+            st = os.statvfs(self.dirs['ram'])
+        except OSError:
+            return False
+        return st.f_bavail * st.f_frsize >= n + self.TMPFS_HEADROOM
+
+    def grow(self, f: ScratchFile, n: int) -> bool:
+        """Count n more bytes for f; False if f is on tmpfs and they don't fit there."""
+        if f.medium == 'ram' and not self._tmpfs_has_room(n):
+            return False
+        with self.lock:
+            if f.medium == 'ram' and self.used['ram'] + n > self.ram_bytes:
+                return False
+            self.used[f.medium] += n
+            f.size += n
+        return True
+
+    def moved(self, f: ScratchFile, old_name: str):
+        with self.lock:
+            self.files.pop(old_name, None)
+            self.files[f.name] = f
+            self.used['ram'] -= f.size
+            self.used['disk'] += f.size
+            f.medium = 'disk'
+        inc('pdfai_scratch_spills_total')
+        self._publish()
+
+    def release(self, path: str, expected: ScratchFile = None):
+        """Delete a scratch file and stop counting it; a file already moved elsewhere (e.g. into the result cache) is just forgotten."""
+        with self.lock:
+            f = self.files.get(path)
+            if f is None or (expected is not None and f is not expected):
+                return  # already released, and the name may since belong to another file
+            del self.files[path]
+            self.used[f.medium] -= f.size
+        f.close()
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        self._publish()
+
+    @contextlib.contextmanager
+    def scope(self):
+        files = []
+        token = _scratch_scope.set(files)
+        try:
+            yield
+        finally:
+            for f in files:
+                self.release(f.name, f)
+            _scratch_scope.reset(token)
+
+    def _publish(self):
+        with self.lock:
+            used = dict(self.used)
+            counts = {medium: sum(1 for f in self.files.values() if f.medium == medium) for medium in used}
+        for medium in used:
+            set_gauge('pdfai_scratch_bytes', used[medium], medium=medium)
+            set_gauge('pdfai_scratch_files', counts[medium], medium=medium)
+
+    def reap(self):
+        """Remove scratch files no live process has touched in SCRATCH_MAX_AGE, e.g. from a crashed worker."""
+        cutoff = time.time() - SCRATCH_MAX_AGE
+        for directory in filter(None, self.dirs.values()):
+            for entry in os.scandir(directory):
+                try:
+                    if entry.path not in self.files and entry.stat().st_mtime < cutoff:
+                        os.remove(entry.path)
+                        inc('pdfai_scratch_reaped_files_total')
+                except OSError:
+                    pass
+        self._publish()
+
+_ram_dir = os.path.join(SCRATCH_RAM_DIR, 'pdf-ai-scratch') if os.path.isdir(SCRATCH_RAM_DIR) else None
+scratch = ScratchSpace(_ram_dir, SCRATCH_DISK_DIR, SCRATCH_RAM_BYTES)
+
+def scratch_janitor():
+    while True:
+        time.sleep(SCRATCH_JANITOR_INTERVAL)
+        try:
+            scratch.reap()
+        except Exception as e:
+            logging.warning(f"Scratch janitor failed: {e}")
+
+if not POOL_WORKER:
+    threading.Thread(target=scratch_janitor, name='scratch-janitor', daemon=True).start()
+
+# ---------------- Translation backends ----------------
+# Each backend translates a list of strings in one upstream request and keeps a
+# single keep-alive connection pool for the life of the process.
+class PooledSessions:
+    """A requests.Session per thread, since sessions aren't thread-safe, all mounted
+    on one HTTPAdapter so every thread draws from the same keep-alive connections."""
+
+    def __init__(self, pool_maxsize: int):
+        self.adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=pool_maxsize)
+        self.local = threading.local()
+
+    def get(self) -> requests.Session:
+        session = getattr(self.local, 'session', None)
+        if session is None:
+            session = self.local.session = requests.Session()
+            session.mount('http://', self.adapter)
+            session.mount('https://', self.adapter)
+        return session
+
+class TranslationBackend:
+    name = None
+
+    def translate(self, texts: list, source: str, target: str) -> list:
+        raise NotImplementedError
+
+    async def translate_async(self, session, texts: list, source: str, target: str) -> list:
+        """Async mode: backends without a non-blocking client run translate() in an executor."""
+        return await asyncio.get_running_loop().run_in_executor(None, self.translate, texts, source, target)
+
+    def detect(self, text: str) -> str:
+        """The language code text is most likely written in."""
+        raise NotImplementedError
+
+    def languages(self) -> list:
+        """Supported languages as [{'code': ..., 'name': ...}]."""
+        raise NotImplementedError
+
+class LibreTranslateBackend(TranslationBackend):
+    name = 'libretranslate'
+
+    def __init__(self, url: str, api_key: str = None):
+        self.url = url if url.endswith('/') else url + '/'
+        self.api_key = api_key
+        self.sessions = PooledSessions(TRANSLATE_CONCURRENCY)
+
+    def _payload(self, payload: dict) -> dict:
+        if self.api_key:
+            payload['api_key'] = self.api_key
+        return payload
+
+    def _post(self, path: str, payload: dict):
+        r = self.sessions.get().post(self.url + path, json=self._payload(payload), timeout=TRANSLATE_TIMEOUT)
+        if r.status_code != 200:
+            raise UpstreamError(f"Translation service error ({r.status_code}): {r.text[:200]}", r.status_code)
+        return r.json()
+
+    @staticmethod
+    def _translations(translated, texts: list) -> list:
+        # LibreTranslate accepts a list for q and answers with a list in the same order.
+        if isinstance(translated, str):
+            translated = [translated]
+        if len(translated) != len(texts):
+            raise ValueError(f"Translation service returned {len(translated)} results for {len(texts)} texts")
+        return translated
+
+    def translate(self, texts, source, target):
+        translated = self._post('translate', {'q': texts, 'source': source, 'target': target, 'format': 'text'})['translatedText']
+        return self._translations(translated, texts)
+
+    async def translate_async(self, session, texts, source, target):
+        payload = self._payload({'q': texts, 'source': source, 'target': target, 'format': 'text'})
+        async with session.post(self.url + 'translate', json=payload,
+                                timeout=aiohttp.ClientTimeout(total=TRANSLATE_TIMEOUT)) as r:
+            if r.status != 200:
+                raise UpstreamError(f"Translation service error ({r.status}): {(await r.text())[:200]}", r.status)
+            translated = (await r.json())['translatedText']
+        return self._translations(translated, texts)
+
+    def detect(self, text):
+        return self._post('detect', {'q': text})[0]['language']
+
+    def languages(self):
+        r = self.sessions.get().get(self.url + 'languages', timeout=10)
+        r.raise_for_status()
+        return [{'code': lang['code'], 'name': lang['name']} for lang in r.json()]
+
+class GoogleV2Backend(TranslationBackend):
+    name = 'google-v2'
+    max_items = 128  # values per request accepted by the v2 API
+
+    def __init__(self):
+        try:
+            from google.cloud import translate_v2
+        except ImportError:
+            raise RuntimeError("TRANSLATE_BACKEND=google-v2 needs the google-cloud-translate package")
+        self.client = translate_v2.Client()  # keeps one authorized keep-alive requests session
+
+    def translate(self, texts, source, target):
+        translated = []
+        for i in range(0, len(texts), self.max_items):
+            results = self.client.translate(texts[i:i + self.max_items], target_language=target,
+                                            source_language=source, format_='text')
+            translated.extend(result['translatedText'] for result in results)
+        return translated
+
+    def detect(self, text):
+        return self.client.detect_language(text)['language']
+
+    def languages(self):
+        return [{'code': lang['language'], 'name': lang.get('name', lang['language'])}
+                for lang in self.client.get_languages(target_language='en')]
+
+class GoogleV3Backend(TranslationBackend):
+    name = 'google-v3'
+
+    def __init__(self, project: str):
+        try:
+            from google.cloud import translate_v3
+        except ImportError:
+            raise RuntimeError("TRANSLATE_BACKEND=google-v3 needs the google-cloud-translate package")
+        if not project:
+            raise RuntimeError("TRANSLATE_BACKEND=google-v3 needs GOOGLE_CLOUD_PROJECT")
+        self.client = translate_v3.TranslationServiceClient()  # one long-lived gRPC channel
+        self.parent = f"projects/{project}/locations/global"
+
+    def translate(self, texts, source, target):
+        response = self.client.translate_text(request={
+            'parent': self.parent, 'contents': texts, 'mime_type': 'text/plain',
+            'source_language_code': source, 'target_language_code': target,
+        }, timeout=TRANSLATE_TIMEOUT)
+        return [t.translated_text for t in response.translations]
+
+    def detect(self, text):
+        response = self.client.detect_language(request={
+            'parent': self.parent, 'content': text, 'mime_type': 'text/plain',
+        }, timeout=TRANSLATE_TIMEOUT)
+        return response.languages[0].language_code
 
-def tts_to_tempfile(text: str, lang: str) -> str:
+    def languages(self):
+        response = self.client.get_supported_languages(parent=self.parent, display_language_code='en')
+        return [{'code': lang.language_code, 'name': lang.display_name or lang.language_code}
+                for lang in response.languages]
+
+def make_translation_backend(name: str) -> TranslationBackend:
+    if name == 'libretranslate':
+        return LibreTranslateBackend(LIBRETRANSLATE_URL, LIBRETRANSLATE_API_KEY)
+    if name == 'google-v2':
+        return GoogleV2Backend()
+    if name == 'google-v3':
+        return GoogleV3Backend(GOOGLE_CLOUD_PROJECT)
+    raise ValueError(f"Unknown TRANSLATE_BACKEND: {name}")
+
+translator = make_translation_backend(TRANSLATE_BACKEND) if not POOL_WORKER else None
+
+# ---------------- Language registry ----------------
+# Languages load from LANGUAGES_CACHE_FILE at startup, so booting a worker never
+# waits on the network. A background thread refetches the list once the file is
+# older than LANGUAGES_TTL and picks up refreshes written by other workers.
+def set_languages(new_languages: list):
+    global languages, VALID_STT_LANGS
+    valid = [lang for lang in new_languages if isinstance(lang, dict) and lang.get('code')]
+    if not valid:
+        raise ValueError("Language list is empty")
+    languages, VALID_STT_LANGS = valid, [lang['code'] for lang in valid]
+    logging.info(f"Loaded {len(VALID_STT_LANGS)} STT languages: {VALID_STT_LANGS}")
+
+def load_cached_languages():
+    try:
+        with open(LANGUAGES_CACHE_FILE) as f:
+            set_languages(json.load(f))
+    except FileNotFoundError:
+        pass
+    except (OSError, ValueError) as e:
+        logging.error(f"Failed to load cached languages: {e}")
+
+def refresh_languages() -> bool:
+    try:
+        fetched = translator.languages()
+        set_languages(fetched)
+        _write_json_atomic(LANGUAGES_CACHE_FILE, fetched)
+        return True
+    except Exception as e:
+        logging.error(f"Failed to fetch languages: {e}")
+        return False
+
+def language_refresher():
+    loaded_mtime = None
+    while True:
+        try:
+            mtime = os.path.getmtime(LANGUAGES_CACHE_FILE)
+        except OSError:
+            mtime = 0
+        if mtime and mtime != loaded_mtime:
+            load_cached_languages()
+            loaded_mtime = mtime
+        age = time.time() - mtime
+        if age >= LANGUAGES_TTL:
+            if refresh_languages():
+                continue
+            time.sleep(LANGUAGES_RETRY)
+        else:
+            time.sleep(min(LANGUAGES_TTL - age, LANGUAGES_RETRY))
+
+if not POOL_WORKER:
+    load_cached_languages()
+    threading.Thread(target=language_refresher, name='languages', daemon=True).start()
+
+# ---------------- Translation memory ----------------
+# Sentences are translated once per backend and language pair and kept in SQLite,
+# keyed by a hash of those and the whitespace-normalized sentence. Only misses go upstream. A single
+# line break is a PDF's hard wrap inside a paragraph, so sentences only end at a
+# terminator or a blank line.
+SENTENCE_SPLIT_RE = re.compile(r'((?<=[.!?\u3002\uff01\uff1f])\s+|\s*\n\s*\n\s*)')
+LINE_BREAK_RE = re.compile(r'\s*\n\s*')
+_tm_local = threading.local()
+tm_stats = {'hits': 0, 'misses': 0}
+tm_stats_lock = threading.Lock()
+
+def _tm_conn() -> sqlite3.Connection:
+    conn = getattr(_tm_local, 'conn', None)
+    if conn is None:
+        conn = sqlite3.connect(TRANSLATION_MEMORY_PATH, timeout=10)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('CREATE TABLE IF NOT EXISTS segments (key TEXT PRIMARY KEY, source TEXT, target TEXT, translated TEXT)')
+        _tm_local.conn = conn
+    return conn
+
+def tm_key(sentence: str, source: str, target: str) -> str:
+    normalized = " ".join(sentence.split())
+    return hashlib.sha256(f"{translator.name}|{source}|{target}|{normalized}".encode()).hexdigest()
+
+def tm_lookup(keys: list) -> dict:
+    found = {}
+    conn = _tm_conn()
+    for i in range(0, len(keys), 500):  # stay under SQLite's bound-variable limit
+        batch = keys[i:i + 500]
+        rows = conn.execute(f"SELECT key, translated FROM segments WHERE key IN ({','.join('?' * len(batch))})", batch)
+        found.update(rows)
+    return found
+
+def tm_store(entries: list):
+    conn = _tm_conn()
+    with conn:
+        conn.executemany('INSERT OR REPLACE INTO segments VALUES (?, ?, ?, ?)', entries)
+
+translate_executor = ThreadPoolExecutor(max_workers=TRANSLATE_CONCURRENCY, thread_name_prefix='translate')
+translate_limiter = upstream_limiter('translate', TRANSLATE_CONCURRENCY)
+
+def pack_chunks(pieces: list, limit: int) -> list:
+    """Group piece indexes, in order, into chunks of at most limit characters."""
+    chunks, current, size = [], [], 0
+    for i, piece in enumerate(pieces):
+        if current and size + len(piece) + 1 > limit:
+            chunks.append(current)
+            current, size = [], 0
+        current.append(i)
+        size += len(piece) + 1
+    if current:
+        chunks.append(current)
+    return chunks
+
+def split_for_upstream(sentences: list):
+    """Return (pieces, owners, chunks) for one upstream call per chunk of pieces."""
+    # Sentences longer than a chunk are cut at word boundaries and glued back after translation.
+    pieces, owners = [], []
+    for i, sentence in enumerate(sentences):
+        for piece in textwrap.wrap(sentence, TRANSLATE_CHUNK_CHARS) or [sentence]:
+            pieces.append(piece)
+            owners.append(i)
+    return pieces, owners, pack_chunks(pieces, TRANSLATE_CHUNK_CHARS)
+
+def join_from_upstream(count: int, owners: list, translated_pieces) -> list:
+    results = [[] for _ in range(count)]
+    for owner, translated in zip(owners, translated_pieces):
+        results[owner].append(translated)
+    return [" ".join(r) for r in results]
+
+def translate_batch(sentences: list, source: str, target: str) -> list:
+    pieces, owners, chunks = split_for_upstream(sentences)
+    futures = [translate_limiter.submit(translate_executor, translate_upstream, [pieces[i] for i in chunk], source, target)
+               for chunk in chunks]
+    try:
+        return join_from_upstream(len(sentences), owners, (t for future in futures for t in future.result()))
+    finally:
+        for future in futures:
+            future.cancel()  # after a failure, don't send the chunks still queued
+
+@upstream_call('translate')
+def translate_upstream(texts: list, source: str, target: str) -> list:
+    return translator.translate(texts, source, target)
+
+def tm_plan(text: str, source: str, target: str):
+    """Split text into sentences and look them up; returns (parts, keys, known, missing)."""
+    text = LINE_BREAK_RE.sub(lambda m: m.group() if m.group().count('\n') > 1 else ' ', text)
+    parts = SENTENCE_SPLIT_RE.split(text)
+    sentences = parts[0::2]
+    keys = [tm_key(sentence, source, target) if sentence.strip() else None for sentence in sentences]
+    known = tm_lookup(list({k for k in keys if k}))
+
+    missing = {}
+    for key, sentence in zip(keys, sentences):
+        if key and key not in known:
+            missing.setdefault(key, sentence.strip())
+    return parts, keys, known, missing
+
+def tm_finish(plan, translated: list, source: str, target: str) -> str:
+    """Store the upstream translations of plan's missing sentences and reassemble the text."""
+    parts, keys, known, missing = plan
+    if missing:
+        known.update(zip(missing, translated))
+        tm_store([(key, source, target, t) for key, t in zip(missing, translated)])
+
+    with tm_stats_lock:
+        total = sum(1 for k in keys if k)
+        tm_stats['misses'] += len(missing)
+        tm_stats['hits'] += total - len(missing)
+    inc('pdfai_translation_memory_segments_total', total - len(missing), result='hit')
+    inc('pdfai_translation_memory_segments_total', len(missing), result='miss')
+
+    parts[0::2] = [known[k] if k else sentence for k, sentence in zip(keys, parts[0::2])]
+    return "".join(parts)
+
+@timed_stage('translate')
+def translate_text(text: str, source: str, target: str) -> str:
+    validate_translate_langs(source, target)  # before anything is queued on the upstream
+    plan = tm_plan(text, source, target)
+    missing = plan[3]
+    translated = translate_batch(list(missing.values()), source, target) if missing else []
+    return tm_finish(plan, translated, source, target)
+
+# ---------------- Text-to-speech ----------------
+# Text is split into sentences (long ones cut to TTS_SEGMENT_CHARS), and each
+# distinct sentence is synthesized once per language and kept in a SQLite segment
+# cache, so repeated headers and boilerplate are spliced in without a gTTS call.
+# Missing sentences are synthesized in parallel. gTTS returns plain MPEG frames, so
+# segments are joined by concatenating their bytes (minus any ID3 tags), with no
+# re-encoding.
+tts_executor = ThreadPoolExecutor(max_workers=TTS_CONCURRENCY, thread_name_prefix='tts')
+tts_limiter = upstream_limiter('tts', TTS_CONCURRENCY)
+tts_sessions = PooledSessions(TTS_CONCURRENCY)
+_tts_local = threading.local()
+TTS_SENTENCE_RE = re.compile(r'(?<=[.!?\u3002\uff01\uff1f])\s+')
+TTS_VOICE = ('com', False)  # gTTS tld and slow; part of the segment cache key
+
+def split_tts_segments(text: str) -> list:
+    # Whitespace is collapsed first so a PDF's line breaks don't split sentences.
+    segments = []
+    for sentence in TTS_SENTENCE_RE.split(" ".join(text.split())):
+        segments += textwrap.wrap(sentence, TTS_SEGMENT_CHARS) if len(sentence) > TTS_SEGMENT_CHARS else [sentence]
+    return [segment for segment in segments if segment]
+
+def _tts_cache_conn() -> sqlite3.Connection:
+    conn = getattr(_tts_local, 'cache_conn', None)
+    if conn is None:
+        conn = sqlite3.connect(TTS_CACHE_PATH, timeout=10)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('CREATE TABLE IF NOT EXISTS segments (key TEXT PRIMARY KEY, audio BLOB, size INTEGER, used REAL)')
+        conn.execute('CREATE INDEX IF NOT EXISTS segments_used ON segments (used)')
+        _tts_local.cache_conn = conn
+    return conn
+
+def tts_cache_key(segment: str, lang: str) -> str:
+    return hashlib.sha256(f"{lang}|{TTS_VOICE[0]}|{TTS_VOICE[1]}|{segment}".encode()).hexdigest()
+
+def tts_cache_lookup(keys: list) -> dict:
+    # Hits only take the write lock for segments whose recorded use is older than
+    # TTS_CACHE_TOUCH_INTERVAL, which is plenty for LRU eviction. A failure (e.g. the
+    # database staying locked under load) is a miss, not a failed request.
+    found, stale = {}, []
+    now = time.time()
+    try:
+        conn = _tts_cache_conn()
+        for i in range(0, len(keys), 500):  # stay under SQLite's bound-variable limit
+            batch = keys[i:i + 500]
+            for key, audio, used in conn.execute(
+                    f"SELECT key, audio, used FROM segments WHERE key IN ({','.join('?' * len(batch))})", batch):
+                found[key] = audio
+                if used < now - TTS_CACHE_TOUCH_INTERVAL:
+                    stale.append((now, key))
+    except sqlite3.Error as e:
+        logging.warning(f"TTS cache lookup failed: {e}")
+        return {}
+    if stale:
+        try:
+            with conn:
+                conn.executemany('UPDATE segments SET used = ? WHERE key = ?', stale)
+        except sqlite3.Error as e:
+            logging.warning(f"TTS cache update failed: {e}")
+    return found
+
+def tts_cache_store(entries: dict):
+    try:
+        _tts_cache_insert(entries)
+    except sqlite3.Error as e:
+        logging.warning(f"TTS cache store failed: {e}")  # the audio was synthesized; only caching it failed
+
+def _tts_cache_insert(entries: dict):
+    conn = _tts_cache_conn()
+    now = time.time()
+    with conn:
+        conn.executemany('INSERT OR REPLACE INTO segments VALUES (?, ?, ?, ?)',
+                         [(key, audio, len(audio), now) for key, audio in entries.items()])
+        total = conn.execute('SELECT COALESCE(SUM(size), 0) FROM segments').fetchone()[0]
+        if total > TTS_CACHE_MAX_BYTES:
+            # Drop least recently used segments until the cache is back under 90% of the cap.
+            excess = total - int(TTS_CACHE_MAX_BYTES * 0.9)
+            stale, freed = [], 0
+            for key, size in conn.execute('SELECT key, size FROM segments ORDER BY used'):
+                if freed >= excess:
+                    break
+                stale.append((key,))
+                freed += size
+            conn.executemany('DELETE FROM segments WHERE key = ?', stale)
+
+@functools.lru_cache(maxsize=None)
+def validate_tts_lang(lang: str) -> str:
+    gTTS(text=lang, lang=lang)  # raises ValueError for a language gTTS doesn't list; makes no request
+    return lang
+
+def plan_tts(text: str, lang: str):
+    """Return (segments, keys, cached audio by key, missing segment by key)."""
+    validate_tts_lang(lang)  # before any segment is queued on the upstream
+    segments = split_tts_segments(text)
+    keys = [tts_cache_key(segment, lang) for segment in segments]
+    cached = tts_cache_lookup(list(set(keys)))
+    missing = {}
+    for key, segment in zip(keys, segments):
+        if key not in cached:
+            missing.setdefault(key, segment)
+    inc('pdfai_tts_cache_segments_total', len(keys) - sum(1 for k in keys if k in missing), result='hit')
+    inc('pdfai_tts_cache_segments_total', sum(1 for k in keys if k in missing), result='miss')
+    return segments, keys, cached, missing
+
+def strip_id3(data: bytes) -> bytes:
+    if data[:3] == b'ID3' and len(data) >= 10:
+        size = (data[6] << 21) | (data[7] << 14) | (data[8] << 7) | data[9]
+        footer = 10 if data[5] & 0x10 else 0
+        data = data[10 + size + footer:]
+    if data[-128:-125] == b'TAG':
+        data = data[:-128]
+    return data
+
+def tts_requests(tts: gTTS) -> list:
+    prepared = tts._prepare_requests()
+    if TTS_ENDPOINT:
+        for pr in prepared:
+            pr.prepare_url(TTS_ENDPOINT, None)
+    return prepared
+
+def tts_frames(tts: gTTS, body: str, response=None) -> bytes:
+    match = re.search(r'jQ1olc","\[\\"(.*?)\\"]', body)
+    if not match:
+        raise gTTSError(tts=tts, response=response)
+    return strip_id3(base64.b64decode(match.group(1)))
+
+@upstream_call('tts')
+def synthesize_segment(text: str, lang: str) -> bytes:
+    """Synthesize one segment like gTTS.stream(), but over this thread's pooled session."""
+    tts = gTTS(text=text, lang=lang)
+    session = tts_sessions.get()
+    audio = []
+    for pr in tts_requests(tts):
+        try:
+            r = session.send(pr, timeout=TTS_TIMEOUT)
+            r.raise_for_status()
+        except requests.exceptions.HTTPError:
+            raise gTTSError(tts=tts, response=r)
+        except requests.exceptions.RequestException:
+            raise gTTSError(tts=tts)
+        audio.append(tts_frames(tts, r.text, r))
+    return b"".join(audio)
+
+def synthesize(text: str, lang: str):
+    """Start synthesizing text; the returned generator yields its MP3 frames in order as they arrive."""
+    return start_synthesis(text, lang)[0]
+
+def start_synthesis(text: str, lang: str) -> tuple:
+    """Like synthesize(), but also return the submitted segment futures, so that a
+    generator that is dropped before it starts can still have them cancelled."""
+    _, keys, cached, missing = plan_tts(text, lang)
+    futures = {key: tts_limiter.submit(tts_executor, synthesize_segment, segment, lang) for key, segment in missing.items()}
+
+    def frames():
+        fresh = {}
+        try:
+            for key in keys:
+                if key not in cached:
+                    cached[key] = fresh[key] = futures[key].result()
+                yield cached[key]
+        finally:
+            for future in futures.values():
+                future.cancel()
+            if fresh:
+                tts_cache_store(fresh)  # keep what was synthesized even if a later segment failed
+
+    return frames(), list(futures.values())
+
+@timed_stage('tts')
+def tts_to_tempfile(text: str, lang: str, fmt: str = 'mp3') -> str:
     text = limit_text(text)
-    tf = tempfile.NamedTemporaryFile(delete=False, suffix=".mp3")
+    tf = scratch.file(f".{AUDIO_FORMATS[fmt][0]}")
+    try:
+        for data in transcode(synthesize(text, lang), fmt):
+            tf.write(data)
+    except Exception:
+        scratch.release(tf.name)
+        raise
     tf.close()
-    gTTS(text=text, lang=lang).save(tf.name)
     return tf.name
 
-def ensure_wav(input_path: str) -> str:
-    audio = AudioSegment.from_file(input_path)
-    wav_path = tempfile.NamedTemporaryFile(delete=False, suffix='.wav').name
-    audio.set_channels(1).set_frame_rate(16000).export(wav_path, format='wav')
-    return wav_path
+def logged_stream(chunks, what: str):
+    """Pass a streamed response body through, logging a failure before re-raising it.
+
+    Headers are already sent by then; re-raising aborts the chunked response so the
+    client sees it as incomplete, and keeps the partial audio out of the cache.
+    """
+    try:
+        yield from chunks
+    except Exception as e:
+        logging.error(f"{what} failed: {e}")
+        raise
+
+def stream_pdf_audio(reader: PdfReader, lang: str):
+    """Yield MP3 bytes page by page, synthesizing each page as soon as it is extracted."""
+    pages = iter_pdf_text(reader)
+    first = next(pages, None)
+    if first is None:
+        raise ValueError("No readable text found in the PDF.")
+
+    def generate():
+        budget = MAX_TEXT_LENGTH
+        for text in itertools.chain([first], pages):
+            text = text.strip()[:budget]
+            budget -= len(text)
+            yield from synthesize(text, lang)
+            if budget <= 0:
+                return
+
+    return logged_stream(generate(), "Streaming TTS")
+
+# Audio is synthesized as gTTS's MP3 and, for the smaller output formats, piped
+# through one ffmpeg process as it arrives, so encoding overlaps synthesis and
+# nothing but the finished result touches a file.
+# format -> (file extension, ffmpeg output arguments, or None to pass the MP3 through)
+AUDIO_FORMATS = {
+    'mp3': ('mp3', None),
+    'mp3-low': ('mp3', ['-ac', '1', '-ar', '16000', '-c:a', 'libmp3lame', '-b:a', MP3_LOW_BITRATE,
+                        '-write_xing', '0', '-f', 'mp3']),
+    'opus': ('ogg', ['-ac', '1', '-c:a', 'libopus', '-b:a', OPUS_BITRATE, '-application', 'voip', '-f', 'ogg']),
+}
+AUDIO_MIMETYPES = {'mp3': 'audio/mpeg', 'ogg': 'audio/ogg'}
+
+def output_format(params) -> str:
+    fmt = params.get('format', 'mp3')
+    if fmt not in AUDIO_FORMATS:
+        raise ValueError(f"Unknown format: {fmt}. Expected one of {', '.join(AUDIO_FORMATS)}")
+    return fmt
+
+def transcoder_command(fmt: str):
+    args = AUDIO_FORMATS[fmt][1]
+    if args is None:
+        return None
+    return [AudioSegment.converter, '-hide_banner', '-loglevel', 'error', '-f', 'mp3', '-i', 'pipe:0', *args, 'pipe:1']
+
+def _feed_stdin(proc, chunks, errors: list = None):
+    """Write chunks to proc's stdin from a helper thread, then close it."""
+    try:
+        for chunk in chunks:
+            proc.stdin.write(chunk)
+    except BrokenPipeError:
+        pass  # ffmpeg stopped reading; its exit status tells us why
+    except Exception as e:
+        if errors is not None:
+            errors.append(e)  # e.g. a TTS failure, re-raised by transcode()
+    finally:
+        if hasattr(chunks, 'close'):
+            chunks.close()
+        try:
+            proc.stdin.close()
+        except OSError:
+            pass
+
+def _drain_stderr(proc):
+    """Read proc's stderr from a helper thread, so ffmpeg never blocks on a full pipe.
+
+    Returns a function that waits for the stream to end and gives its last few KB as text.
+    """
+    tail = bytearray()
+
+    def drain():
+        for data in iter(lambda: proc.stderr.read1(4096), b''):
+            tail.extend(data)
+            del tail[:-4096]
+
+    thread = threading.Thread(target=drain, daemon=True)
+    thread.start()
+
+    def message() -> str:
+        thread.join()
+        return tail.decode(errors='replace').strip()
+    return message
+
+def transcode(chunks, fmt: str):
+    """Yield MP3 chunks re-encoded to fmt as ffmpeg produces them."""
+    command = transcoder_command(fmt)
+    if command is None:
+        yield from chunks
+        return
+    proc = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    errors = []
+    threading.Thread(target=_feed_stdin, args=(proc, chunks, errors), daemon=True).start()
+    stderr = _drain_stderr(proc)
+    try:
+        for data in iter(lambda: proc.stdout.read1(64 * 1024), b''):
+            yield data
+        error = stderr()
+        proc.wait()
+        if errors:
+            raise errors[0]
+        if proc.returncode != 0:
+            raise ValueError(f"Audio encoding failed: {error}")
+    finally:
+        if proc.poll() is None:
+            proc.kill()  # the client went away; the feeder stops at its next write
+            proc.wait()
+        stderr()
+        proc.stdout.close()
+        proc.stderr.close()
+
+@timed_stage('convert')
+def decode_to_pcm(audio_file) -> bytes:
+    """Decode an upload to 16 kHz mono 16-bit PCM in one ffmpeg pass, entirely over pipes."""
+    audio_file.seek(0)
+    proc = subprocess.Popen(
+        [AudioSegment.converter, '-hide_banner', '-loglevel', 'error', '-i', 'pipe:0',
+         '-f', 's16le', '-acodec', 'pcm_s16le', '-ac', '1', '-ar', str(STT_SAMPLE_RATE), 'pipe:1'],
+        stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    chunks = iter(functools.partial(audio_file.read, 64 * 1024), b'')
+    feeder = threading.Thread(target=_feed_stdin, args=(proc, chunks), daemon=True)
+    feeder.start()
+    stderr = _drain_stderr(proc)
+    timed_out = threading.Event()
+
+    def expire():
+        timed_out.set()
+        proc.kill()
 
-def convert_to_wav(audio_file) -> str:
-    tf = tempfile.NamedTemporaryFile(delete=False, suffix='.wav')
+    watchdog = threading.Timer(STT_DECODE_TIMEOUT, expire)
+    watchdog.start()
     try:
+        pcm = proc.stdout.read()
+        error = stderr()
+        proc.wait()
+        feeder.join()
+    finally:
+        watchdog.cancel()
+        if proc.poll() is None:
+            proc.kill()
+            proc.wait()
+        proc.stdout.close()
+        proc.stderr.close()
+    if timed_out.is_set():
+        raise ValueError(f"Audio conversion took longer than {STT_DECODE_TIMEOUT} s")
+    if proc.returncode == 0 and pcm:
+        return pcm
+
+    # Containers that need seeking (e.g. MP4 with the index at the end) can't be read
+    # from a pipe; let pydub decode those from a file instead.
+    logging.info(f"Piped decode failed ({error or 'no audio'}), falling back to pydub")
+    try:
+        audio_file.seek(0)
         audio = AudioSegment.from_file(audio_file)
-        audio = audio.set_channels(1).set_frame_rate(16000)
-        audio.export(tf.name, format='wav')
+        return audio.set_channels(1).set_frame_rate(STT_SAMPLE_RATE).set_sample_width(2).raw_data
     except Exception as e:
         raise ValueError(f"Audio conversion failed: {str(e)}")
-    return tf.name
 
-def stt_google(audio_path: str, language: str = 'en') -> str:
-    language = validate_stt_lang(language)
+# Long recordings are cut into segments of STT_SEGMENT_MIN_SECONDS to
+# STT_SEGMENT_MAX_SECONDS at the quietest stretch of each window, recognized
+# concurrently, and the transcripts joined back in order.
+stt_executor = ThreadPoolExecutor(max_workers=STT_CONCURRENCY, thread_name_prefix='stt')
+stt_limiter = upstream_limiter('stt', STT_CONCURRENCY)
+
+def split_on_silence(pcm: bytes) -> list:
+    frame_bytes = STT_SAMPLE_RATE * 2 * STT_FRAME_MS // 1000
+    frames = len(pcm) // frame_bytes
+    min_frames = STT_SEGMENT_MIN_SECONDS * 1000 // STT_FRAME_MS
+    max_frames = STT_SEGMENT_MAX_SECONDS * 1000 // STT_FRAME_MS
+    if frames <= max_frames:
+        return [pcm]
+
+    # Energy per frame, smoothed over ~300 ms so a cut lands in a pause rather than between syllables.
+    energy = [audioop.rms(pcm[i * frame_bytes:(i + 1) * frame_bytes], 2) for i in range(frames)]
+    window = max(1, 300 // STT_FRAME_MS)
+    running = [0]
+    for e in energy:
+        running.append(running[-1] + e)
+    smoothed = [running[min(i + window, frames)] - running[max(i - window, 0)] for i in range(frames)]
+
+    segments, start = [], 0
+    while frames - start > max_frames:
+        cut = min(range(start + min_frames, start + max_frames), key=smoothed.__getitem__)
+        segments.append(pcm[start * frame_bytes:cut * frame_bytes])
+        start = cut
+    segments.append(pcm[start * frame_bytes:])
+    return segments
+
+@upstream_call('stt')
+def recognize_segment(pcm: bytes, language: str) -> str:
     recognizer = sr.Recognizer()
-    wav_path = ensure_wav(audio_path)
+    recognizer.operation_timeout = STT_TIMEOUT
+    audio_data = sr.AudioData(pcm, STT_SAMPLE_RATE, 2)
     try:
-        with sr.AudioFile(wav_path) as source:
-            audio_data = recognizer.record(source)
-        return recognizer.recognize_google(audio_data, language=language.split('-')[0])
+        return recognizer.recognize_google(audio_data, language=language, endpoint=STT_ENDPOINT)
     except sr.UnknownValueError:
-        raise ValueError("Could not understand the audio.")
+        return ""  # a segment of music or silence shouldn't sink the whole transcript
     except sr.RequestError as e:
         raise ValueError(f"Speech service error: {e}")
+
+@timed_stage('stt')
+def stt_google(pcm: bytes, language: str = 'en') -> str:
+    language = validate_stt_lang(language).split('-')[0]
+    futures = [stt_limiter.submit(stt_executor, recognize_segment, segment, language) for segment in split_on_silence(pcm)]
+    try:
+        text = " ".join(t for t in (future.result() for future in futures) if t)
     finally:
+        for future in futures:
+            future.cancel()
+    if not text:
+        raise ValueError("Could not understand the audio.")
+    return text
+
+# ---------- Stage pools ----------
+# CPU-bound stages run apart from request threads and from the upstream pools:
+# PDF parsing in a process pool sized to the cores, and ffmpeg decodes in a thread
+# pool of the same size (each thread only waits on its ffmpeg process). Each pool
+# caps its queue at CPU_QUEUE_DEPTH; past that, new work is refused with 429, so a
+# burst of heavy PDFs can't queue without bound or hold up audio requests.
+class StagePool:
+    def __init__(self, name: str, workers: int, processes: bool = False):
+        self.name = name
+        self.workers = workers
+        self.processes = processes
+        self.pending = 0
+        self.duration = 1.0  # moving average, for Retry-After
+        self.lock = threading.Lock()
+        self._executor = None
+
+    def executor(self):
+        with self.lock:
+            if self._executor is None:
+                if self.processes:
+                    # Spawned rather than forked, since the parent holds live threads and locks.
+                    self._executor = ProcessPoolExecutor(max_workers=self.workers,
+                                                         mp_context=multiprocessing.get_context('spawn'))
+                else:
+                    self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix=self.name)
+            return self._executor
+
+    def run(self, fn, *args):
+        """Run fn in the pool and wait for it, or raise Overloaded if the queue is full."""
+        with self.lock:
+            if self.pending >= self.workers + CPU_QUEUE_DEPTH:
+                inc('pdfai_shed_requests_total', upstream=self.name)
+                raise Overloaded(self.name, max(1, int(self.pending / self.workers * self.duration + 0.999)))
+            self.pending += 1
+            set_gauge('pdfai_stage_pool_tasks', self.pending, pool=self.name)
+        executor = self.executor()
+        start = time.perf_counter()
         try:
-            os.unlink(wav_path)
-        except Exception as e:
-            logging.error(f"Failed to delete temp file {wav_path}: {e}")
+            return executor.submit(fn, *args).result()
+        except BrokenProcessPool:
+            with self.lock:
+                if self._executor is executor:
+                    self._executor = None  # the next task gets a fresh pool
+            raise ValueError(f"The {self.name} worker process crashed on this file.")
+        finally:
+            elapsed = time.perf_counter() - start
+            with self.lock:
+                self.pending -= 1
+                self.duration = 0.8 * self.duration + 0.2 * elapsed
+                set_gauge('pdfai_stage_pool_tasks', self.pending, pool=self.name)
+
+extract_stage = StagePool('extract', CPU_WORKERS, processes=True)
+convert_stage = StagePool('convert', CPU_WORKERS)
+
+def extract_in_pool(path: str, extract=extract_pdf_path):
+    with measure_stage('extract'):  # the worker process's own metrics stay in that process
+        return extract_stage.run(extract, path)
+
+def extract_upload_in_pool(file, extract=extract_pdf_path):
+    with scratch.file('.pdf') as tf:
+        check_file_size(file)
+        shutil.copyfileobj(file, tf)
+        tf.flush()
+        return extract_in_pool(tf.name, extract)
+
+def decode_in_pool(audio_file) -> bytes:
+    return convert_stage.run(decode_to_pcm, audio_file)
+
+# ---------- Pipelines ----------
+# Each pipeline takes the uploaded file, the request parameters and a progress
+# callback, and returns either a path to an MP3 file or a JSON-able dict.
+def _no_progress(stage: str):
+    pass
+
+# The PDF pipelines are split after extraction so batches can extract in a process pool.
+def pdf_text_to_audio(text: str, params, progress=_no_progress) -> str:
+    lang = params.get('lang', 'en')
+    progress('tts')
+    return tts_to_tempfile(text, lang, output_format(params))
+
+def pipeline_translate(text: str, source: str, target: str, progress=_no_progress) -> str:
+    logging.info(f"Translating text: '{text[:50]}...' (len={len(text)}) to {target}")
+    progress('translate')
+    return translate_text(text, source, target)
+
+def translate_pdf_text(text: str, params, progress=_no_progress) -> str:
+    # English unless the document says otherwise
+    return pipeline_translate(text, params.get('source', 'en'), params.get('lang', 'en'), progress)
+
+def pdf_text_to_translate(text: str, params, progress=_no_progress) -> dict:
+    return {"translated_text": translate_pdf_text(text, params, progress)}
+
+def pdf_text_to_translate_audio(text: str, params, progress=_no_progress) -> str:
+    translated = translate_pdf_text(text, params, progress)
+    progress('tts')
+    return tts_to_tempfile(translated, params.get('lang', 'en'), output_format(params))
+
+def run_pdf_to_audio(pdf, params, progress=_no_progress) -> str:
+    progress('extract')
+    return pdf_text_to_audio(extract_upload_in_pool(pdf), params, progress)
+
+def run_pdf_to_translate(pdf, params, progress=_no_progress) -> dict:
+    progress('extract')
+    return pdf_text_to_translate(extract_upload_in_pool(pdf), params, progress)
+
+def run_pdf_to_translate_audio(pdf, params, progress=_no_progress) -> str:
+    progress('extract')
+    return pdf_text_to_translate_audio(extract_upload_in_pool(pdf), params, progress)
+
+def run_audio_to_text(audio, params, progress=_no_progress) -> dict:
+    stt_lang = params.get('stt_lang', 'en')
+    check_file_size(audio)
+    progress('convert')
+    pcm = decode_in_pool(audio)
+    progress('stt')
+    text = stt_google(pcm, language=stt_lang)
+    return {"text": text}
+
+def run_audio_to_translate(audio, params, progress=_no_progress) -> dict:
+    stt_lang = params.get('stt_lang', 'en')
+    target = params.get('lang', 'en')
+    text = run_audio_to_text(audio, params, progress)["text"]
+    translated = pipeline_translate(text, stt_lang.split('-')[0], target, progress)
+    return {"text": text, "translated_text": translated}
+
+def run_audio_to_audio(audio, params, progress=_no_progress) -> str:
+    target_lang = params.get('lang', 'en')
+    translated = run_audio_to_translate(audio, params, progress)["translated_text"]
+    progress('tts')
+    return tts_to_tempfile(translated, target_lang, output_format(params))
+
+# mode -> (upload field, stages, pipeline, download name for audio results)
+PIPELINES = {
+    'pdf_audio': ('pdf', ['extract', 'tts'], run_pdf_to_audio, 'audiobook.mp3'),
+    'pdf_translate': ('pdf', ['extract', 'translate'], run_pdf_to_translate, None),
+    'pdf_translate_audio': ('pdf', ['extract', 'translate', 'tts'], run_pdf_to_translate_audio, 'translated_audiobook.mp3'),
+    'audio_text': ('audio', ['convert', 'stt'], run_audio_to_text, None),
+    'audio_translate': ('audio', ['convert', 'stt', 'translate'], run_audio_to_translate, None),
+    'audio_audio': ('audio', ['convert', 'stt', 'translate', 'tts'], run_audio_to_audio, 'translated_audio.mp3'),
+}
+
+# ---------- Streaming audio-to-audio ----------
+# /audio-to-audio/stream runs recognition, translation and synthesis side by side
+# instead of each over the whole clip in turn. Speech segments are recognized up to
+# STREAM_QUEUE_DEPTH ahead, each transcript is translated as soon as it arrives, and
+# each translation is synthesized and sent while later segments are still in flight.
+# Every stage runs in its own thread and hands its output on over a bounded queue, so
+# a slow client or upstream holds the earlier stages back instead of letting them
+# buffer the whole clip. The caller gets a cancel() that stops every stage and drops
+# whatever is still queued, to run when the response is closed however that happens.
+_STREAM_END = object()
+
+def _stream_put(q: queue.Queue, item, cancelled: threading.Event) -> bool:
+    while not cancelled.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+def _stream_items(q: queue.Queue, cancelled: threading.Event):
+    """Yield a stage's output until its end marker, re-raising a failure passed down the pipeline."""
+    while not cancelled.is_set():
+        try:
+            item = q.get(timeout=0.1)
+        except queue.Empty:
+            continue
+        if item is _STREAM_END:
+            return
+        if isinstance(item, Exception):
+            raise item
+        yield item
+
+def _stream_discard(item):
+    """Cancel the upstream work behind a stage output that will never be consumed."""
+    if isinstance(item, Future):
+        item.cancel()
+    elif isinstance(item, tuple):  # (frames, futures) from start_synthesis()
+        frames, futures = item
+        frames.close()
+        for future in futures:
+            future.cancel()
+
+def _stream_drain(q: queue.Queue):
+    while True:
+        try:
+            _stream_discard(q.get_nowait())
+        except queue.Empty:
+            return
+
+def _stream_stage(fn, items, outbox: queue.Queue, cancelled: threading.Event):
+    """Put fn(item) on outbox for each item, in order, skipping Nones, then the end marker."""
+    try:
+        for item in items:
+            result = fn(item)
+            if result is not None and not _stream_put(outbox, result, cancelled):
+                _stream_discard(result)
+                return
+    except Exception as e:
+        _stream_put(outbox, e, cancelled)  # the next stage re-raises it
+        return
+    finally:
+        if cancelled.is_set():
+            _stream_drain(outbox)  # anything put just before the cancel, which nobody will take
+    _stream_put(outbox, _STREAM_END, cancelled)
+
+def stream_audio_to_audio(pcm: bytes, params) -> tuple:
+    """Return (generator of translated MP3 frames, cancel); the first segment is ready before this returns."""
+    language = validate_stt_lang(params.get('stt_lang', 'en')).split('-')[0]
+    target = params.get('lang', 'en')
+    validate_translate_langs(language, target)
+    validate_tts_lang(target)
+    cancelled = threading.Event()
+    transcripts, translations, audio = (queue.Queue(STREAM_QUEUE_DEPTH) for _ in range(3))
+
+    def recognize(segment: bytes):
+        return stt_limiter.submit(stt_executor, recognize_segment, segment, language)
+
+    def translate(future):
+        text = future.result()
+        return translate_text(text, language, target) if text else None  # skip music and silence
+
+    def speak(text: str):
+        return start_synthesis(text, target)  # already submitted, so several segments synthesize at once
+
+    def cancel():
+        cancelled.set()
+        for q in (transcripts, translations, audio):
+            _stream_drain(q)
+
+    stages = [(recognize, split_on_silence(pcm), transcripts),
+              (translate, _stream_items(transcripts, cancelled), translations),
+              (speak, _stream_items(translations, cancelled), audio)]
+    for fn, items, outbox in stages:
+        threading.Thread(target=_stream_stage, args=(fn, items, outbox, cancelled),
+                         name=f"stream-{fn.__name__}", daemon=True).start()
+
+    def segments():
+        for frames, _ in _stream_items(audio, cancelled):
+            yield from frames  # closing this closes the segment being sent, cancelling its futures
+
+    frames = segments()
+
+    def generate(first: bytes):
+        try:
+            yield first
+            yield from frames
+        finally:
+            frames.close()
+            cancel()
+
+    try:
+        first = next(frames, None)
+        if first is None:
+            raise ValueError("Could not understand the audio.")
+    except BaseException:
+        frames.close()
+        cancel()
+        raise
+    return logged_stream(generate(first), "Streaming audio translation"), cancel
+
+# ---------- Result cache ----------
+# Finished results are stored in RESULT_CACHE_DIR under a key derived from the
+# upload's SHA-256, the route and the language pair. Hits refresh the file's
+# mtime, and the oldest files are evicted once RESULT_CACHE_MAX_BYTES is exceeded.
+def hash_upload(file_storage) -> str:
+    stream = getattr(file_storage, 'stream', file_storage)
+    if isinstance(stream, UploadBuffer):
+        return stream.sha256.hexdigest()  # computed while the upload was received
+    digest = hashlib.sha256()
+    file_storage.seek(0)
+    for chunk in iter(lambda: file_storage.read(64 * 1024), b''):
+        digest.update(chunk)
+    file_storage.seek(0)
+    return digest.hexdigest()
+
+def has_audio_result(mode: str) -> bool:
+    # The streamed modes aren't in PIPELINES; both produce audio.
+    return mode not in PIPELINES or PIPELINES[mode][3] is not None
+
+def result_cache_key(upload_hash: str, mode: str, params) -> str:
+    source = params.get('stt_lang' if PIPELINES.get(mode, ('pdf',))[0] == 'audio' else 'source', 'en')
+    target = '' if mode == 'audio_text' else params.get('lang', 'en')
+    fmt = output_format(params) if has_audio_result(mode) else 'mp3'
+    variant = '' if fmt == 'mp3' else f"|{fmt}"  # MP3 keys are unchanged from before formats existed
+    if 'translate' in PIPELINES.get(mode, ('', []))[1]:
+        variant += f"|{translator.name}"  # another backend translates differently
+    return hashlib.sha256(f"{upload_hash}|{mode}|{source}|{target}{variant}".encode()).hexdigest()
+
+def _result_path(key: str, ext: str) -> str:
+    return os.path.join(RESULT_CACHE_DIR, f"{key}.{ext}")
+
+def cache_get(key: str):
+    """Return the cached audio path or JSON dict for key, or None on a miss."""
+    for ext in (*AUDIO_MIMETYPES, 'json'):
+        path = _result_path(key, ext)
+        try:
+            os.utime(path)  # mark as recently used
+            if ext != 'json':
+                return path
+            with open(path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            continue
+    return None
+
+def evict_results(reserve: int = 0):
+    entries = []
+    total = reserve
+    for entry in os.scandir(RESULT_CACHE_DIR):
+        try:
+            stat = entry.stat()
+        except OSError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total += stat.st_size
+    for _, size, path in sorted(entries):
+        if total <= RESULT_CACHE_MAX_BYTES:
+            break
+        try:
+            os.remove(path)
+            total -= size
+        except OSError:
+            pass
+
+def cache_put(key: str, result):
+    """Move an audio temp file (or write a JSON dict) into the cache and return the cached result."""
+    if isinstance(result, str):
+        evict_results(reserve=os.path.getsize(result))
+        path = _result_path(key, os.path.splitext(result)[1][1:])
+        shutil.move(result, path)
+        scratch.release(result)
+        return path
+    path = _result_path(key, 'json')
+    evict_results(reserve=len(json.dumps(result)))
+    _write_json_atomic(path, result)
+    return result
+
+def cache_stream(key: str, chunks, ext: str = 'mp3'):
+    """Pass chunks through while teeing them to a temp file that is cached once the stream completes."""
+    tf = scratch.file(f".{ext}")
+    try:
+        for chunk in chunks:
+            tf.write(chunk)
+            yield chunk
+        tf.close()
+        cache_put(key, tf.name)
+    finally:
+        scratch.release(tf.name)
+
+# ---------- Single flight ----------
+# Identical requests that arrive together run the pipeline once. Threads in this
+# process wait on the first one's Future; other gunicorn workers queue on an flock
+# of a per-key lock file and then find the result in the cache.
+_inflight = {}
+_inflight_lock = threading.Lock()
+
+def _lock_key_file(key: str):
+    # The holder deletes the file when done, so retry if we locked a file that has
+    # since been unlinked; otherwise two workers could each hold "the" lock.
+    path = _result_path(key, 'lock')
+    while True:
+        f = open(path, 'a')
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            if os.fstat(f.fileno()).st_ino == os.stat(path).st_ino:
+                return f, path
+        except FileNotFoundError:
+            pass
+        f.close()
+
+def _compute_across_workers(key: str, mode: str, compute):
+    if fcntl is None:
+        return cache_put(key, compute())
+    f, path = _lock_key_file(key)
+    try:
+        cached = cache_get(key)
+        if cached is not None:  # another worker finished it while we waited
+            inc('pdfai_coalesced_requests_total', mode=mode, scope='process')
+            return cached
+        return cache_put(key, compute())
+    finally:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        f.close()
+
+def cached_result(key: str, mode: str, compute):
+    cached = cache_get(key)
+    inc('pdfai_result_cache_requests_total', result='miss' if cached is None else 'hit')
+    if cached is not None:
+        logging.info(f"Result cache hit for {mode} ({key[:12]})")
+        return cached
+
+    admit_stages(PIPELINES[mode][1])
+    with _inflight_lock:
+        future = _inflight.get(key)
+        leader = future is None
+        if leader:
+            future = _inflight[key] = Future()
+    if not leader:
+        logging.info(f"Waiting on an identical {mode} request in flight ({key[:12]})")
+        inc('pdfai_coalesced_requests_total', mode=mode, scope='thread')
+        return future.result()
+
+    try:
+        result = _compute_across_workers(key, mode, compute)
+        future.set_result(result)
+        return result
+    except BaseException as e:
+        future.set_exception(e)
+        raise
+    finally:
+        with _inflight_lock:
+            del _inflight[key]
+
+def run_pipeline(mode: str, upload, params, progress=_no_progress):
+    key = result_cache_key(hash_upload(upload), mode, params)
+    return cached_result(key, mode, lambda: PIPELINES[mode][2](upload, params, progress))
+
+def result_etag(audio_path: str) -> str:
+    # The cache key already names the input; the size tells apart a result regenerated after eviction.
+    return f"{os.path.splitext(os.path.basename(audio_path))[0]}-{os.path.getsize(audio_path)}"
+
+def send_audio(audio_path: str, download_name: str, as_attachment: bool = True):
+    # Audio results live in the result cache, so they are not deleted after sending, and
+    # Content-Location points players at /results/, where seeks and replays are ranged reads.
+    ext = os.path.splitext(audio_path)[1][1:]
+    response = send_file(audio_path, mimetype=AUDIO_MIMETYPES[ext], as_attachment=as_attachment,
+                         download_name=f"{os.path.splitext(download_name)[0]}.{ext}", etag=result_etag(audio_path))
+    response.headers['Content-Location'] = f"/results/{os.path.basename(audio_path)}"
+    return response
+
+# ---------- Jobs ----------
+# Jobs run on a local worker pool. Their state lives in JOBS_DIR (one JSON file
+# per job, plus the MP3 result) so that any gunicorn worker can answer a poll.
+job_executor = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix='job')
+
+def _job_path(job_id: str, ext: str = 'json') -> str:
+    return os.path.join(JOBS_DIR, f"{job_id}.{ext}")
+
+def load_job(job_id: str):
+    if not re.fullmatch(r'[0-9a-f]{32}', job_id):
+        return None
+    try:
+        with open(_job_path(job_id)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def reap_expired(directory: str, ttl: int):
+    cutoff = time.time() - ttl
+    for name in os.listdir(directory):
+        path = os.path.join(directory, name)
+        try:
+            if os.path.getmtime(path) < cutoff:
+                os.remove(path)
+        except OSError:
+            pass
+
+def run_job(job: dict, upload, params: dict):
+    stages = PIPELINES[job['mode']][1]
+
+    def progress(stage):
+        job.update(status='running', stage=stage, progress=round(stages.index(stage) / len(stages), 2))
+        _write_json_atomic(_job_path(job['id']), job)
+
+    try:
+        with scratch.scope():
+            result = run_pipeline(job['mode'], upload, params, progress)
+        if isinstance(result, str):
+            shutil.copyfile(result, _job_path(job['id'], AUDIO_FORMATS[job['format']][0]))
+            result = None
+        job.update(status='done', stage=None, progress=1.0, result=result)
+    except Exception as e:
+        logging.error(f"Job {job['id']} ({job['mode']}) failed in stage {job['stage']}: {e}")
+        job.update(status='failed', error=str(e))
+    finally:
+        upload.close()
+        job['finished'] = time.time()
+        _write_json_atomic(_job_path(job['id']), job)
+
+def job_status(job: dict) -> dict:
+    status = {k: job[k] for k in ('id', 'mode', 'status', 'stage', 'progress', 'error', 'created', 'finished')}
+    status['stages'] = PIPELINES[job['mode']][1]
+    status['status_url'] = f"/jobs/{job['id']}"
+    if job['status'] == 'done':
+        status['result_url'] = f"/jobs/{job['id']}/result"
+    return status
+
+# ---------- Documents ----------
+# A PDF uploaded to /documents is parsed once and kept in DOCUMENTS_DIR (one JSON
+# file per document, so any gunicorn worker can use it) with its text, page offsets,
+# detected language and upload hash. The PDF routes then take a document_id instead
+# of the file, and share the result cache with uploads of the same PDF. Each use
+# pushes expiry back by DOCUMENT_TTL.
+def _document_path(document_id: str) -> str:
+    return os.path.join(DOCUMENTS_DIR, f"{document_id}.json")
+
+def load_document(document_id: str):
+    if not re.fullmatch(r'[0-9a-f]{32}', document_id):
+        return None
+    path = _document_path(document_id)
+    try:
+        if os.path.getmtime(path) < time.time() - DOCUMENT_TTL:
+            return None  # expired but not yet reaped
+        with open(path) as f:
+            document = json.load(f)
+        os.utime(path)
+        return document
+    except (OSError, ValueError):
+        return None
+
+@upstream_call('translate')
+def detect_language(text: str) -> str:
+    return translator.detect(text)
+
+def create_document(pdf) -> dict:
+    upload_hash = hash_upload(check_file_size(pdf))
+    text, pages = extract_upload_in_pool(pdf, extract_pdf_pages_path)
+    try:
+        language = translate_limiter.submit(translate_executor, detect_language, text[:DETECT_SAMPLE_CHARS]).result()
+    except Exception as e:
+        logging.warning(f"Language detection failed, assuming English: {e}")
+        language = None
+    reap_expired(DOCUMENTS_DIR, DOCUMENT_TTL)
+    document = {'id': uuid.uuid4().hex, 'upload_hash': upload_hash, 'text': text, 'pages': pages,
+                'language': language, 'created': time.time()}
+    _write_json_atomic(_document_path(document['id']), document)
+    return document
+
+def document_status(document: dict) -> dict:
+    status = {k: document[k] for k in ('id', 'pages', 'language', 'created')}
+    status['characters'] = len(document['text'])
+    status['expires'] = time.time() + DOCUMENT_TTL
+    status['document_url'] = f"/documents/{document['id']}"
+    return status
+
+def run_document(mode: str, document: dict, params):
+    params = params.to_dict()
+    if 'translate' in PIPELINES[mode][1]:
+        # Translation starts from the detected language unless the request names a source.
+        # Other modes leave it out, so their keys match direct uploads of the same PDF.
+        params.setdefault('source', document['language'] or 'en')
+    key = result_cache_key(document['upload_hash'], mode, params)
+    return cached_result(key, mode, lambda: BATCH_MODES[mode](document['text'], params))
+
+# ---------- Batch ----------
+# A batch is a multipart set of PDFs, or ZIPs of them. Extraction goes through the
+# extract stage pool and translation and TTS through the upstream pools, shared
+# with every other request. Results stream back in completion order.
+BATCH_MODES = {
+    'pdf_audio': pdf_text_to_audio,
+    'pdf_translate': pdf_text_to_translate,
+    'pdf_translate_audio': pdf_text_to_translate_audio,
+}
+batch_executor = ThreadPoolExecutor(max_workers=BATCH_CONCURRENCY, thread_name_prefix='batch')
+def collect_batch_documents(uploads) -> list:
+    """Write every PDF of a batch to scratch files and return [(name, path)]."""
+    documents = []
+
+    def add(name: str, source):
+        if len(documents) >= BATCH_MAX_FILES:
+            raise ValueError(f"A batch can hold at most {BATCH_MAX_FILES} files")
+        f = scratch.file('.pdf')
+        shutil.copyfileobj(source, f)
+        f.close()
+        documents.append((os.path.basename(name), f.name))
+
+    for upload in uploads:
+        if not upload or not upload.filename:
+            continue
+        if zipfile.is_zipfile(upload.stream):
+            with zipfile.ZipFile(upload.stream) as archive:
+                for info in archive.infolist():
+                    if info.is_dir() or info.filename.startswith('__MACOSX/') or not info.filename.lower().endswith('.pdf'):
+                        continue
+                    if info.file_size > MAX_FILE_SIZE:
+                        raise ValueError(f"{info.filename} exceeds the {MAX_FILE_SIZE / 1024 / 1024}MB limit")
+                    with archive.open(info) as member:
+                        add(info.filename, member)
+        else:
+            upload.stream.seek(0)
+            add(upload.filename, upload.stream)
+    if not documents:
+        raise ValueError("No PDF files found in the batch")
+    return documents
+
+def run_batch_document(path: str, mode: str, params):
+    with open(path, 'rb') as f:
+        key = result_cache_key(hash_upload(f), mode, params)
+    with scratch.scope():
+        return cached_result(key, mode, lambda: BATCH_MODES[mode](extract_in_pool(path), params))
+
+def run_batch(documents: list, mode: str, params):
+    """Yield (index, name, result, error) for each document as it finishes."""
+    futures = {batch_executor.submit(run_batch_document, path, mode, params): (index, name)
+               for index, (name, path) in enumerate(documents)}
+    try:
+        for future in as_completed(futures):
+            index, name = futures[future]
+            try:
+                yield index, name, future.result(), None
+            except Exception as e:
+                logging.error(f"Batch document {name} failed: {str(e)}")
+                yield index, name, None, str(e)
+    finally:
+        for future in futures:
+            future.cancel()  # the client went away; don't start what's still queued
+
+def batch_ndjson(results):
+    for index, name, result, error in results:
+        yield json.dumps({"index": index, "name": name, **(result if error is None else {"error": error})}) + "\n"
+
+class _ZipSink:
+    """Write-only file for zipfile; the bytes it receives are drained into the response."""
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data, self.chunks = b"".join(self.chunks), []
+        return data
+
+def _write_batch_zip(sink: _ZipSink, results):
+    # Audio is already compressed, so entries are stored. Failed documents get an
+    # .error.txt entry instead, so one bad file doesn't sink the archive.
+    with zipfile.ZipFile(sink, 'w', zipfile.ZIP_STORED) as archive:
+        for index, name, result, error in results:
+            stem = f"{index:03d}-{os.path.splitext(name)[0]}"
+            try:
+                mp3 = open(result, 'rb') if error is None else None
+            except OSError as e:
+                mp3, error = None, str(e)
+            if mp3 is None:
+                archive.writestr(f"{stem}.error.txt", error)
+            else:
+                with mp3, archive.open(f"{stem}{os.path.splitext(result)[1]}", 'w') as entry:
+                    for chunk in iter(lambda: mp3.read(64 * 1024), b''):
+                        entry.write(chunk)
+                        yield
+            yield
+    yield
+
+def batch_zip(results):
+    sink = _ZipSink()
+    for _ in _write_batch_zip(sink, results):
+        data = sink.drain()
+        if data:
+            yield data
+
+# ---------- Async mode ----------
+# An aiohttp server for the I/O-bound routes, where nearly all wall time is spent
+# waiting on upstreams. Upstream calls are awaited on one event loop instead of
+# each holding a thread, so a process keeps hundreds of requests in flight; PDF
+# parsing and audio decoding go to the stage pools, and everything else that
+# blocks (silence splitting, FLAC encoding, the SQLite caches, result cache files
+# and scratch file writes) to the loop's default executor. Run it with
+#     gunicorn app:aio_app --worker-class aiohttp.GunicornWebWorker
+# or `python app.py --async`, and route the other paths to the Flask app.
+_aio = {}  # the event loop's client session and per-upstream limits
+_aio_inflight = {}
+
+async def _blocking(fn, *args):
+    """Run fn in the loop's default executor, so a disk or SQLite wait doesn't stall other requests."""
+    return await asyncio.get_running_loop().run_in_executor(None, fn, *args)
+
+class AioUpstreamLimit:
+    """Async mode's cap on concurrent calls to one upstream. It counts waiting and running
+    calls and their latency like AdaptiveLimiter, so new requests are shed the same way."""
+    admit = AdaptiveLimiter.admit
+
+    def __init__(self, name: str, limit: int):
+        self.name = name
+        self.limit = limit
+        self.semaphore = asyncio.Semaphore(limit)
+        self.pending = 0
+        self.latency = 0.0
+
+    def backlog_seconds(self) -> float:
+        return self.pending / self.limit * self.latency
+
+    @contextlib.asynccontextmanager
+    async def slot(self):
+        self.pending += 1
+        try:
+            async with self.semaphore:
+                start = time.perf_counter()
+                try:
+                    yield
+                finally:
+                    latency = time.perf_counter() - start
+                    self.latency = latency if not self.latency else 0.8 * self.latency + 0.2 * latency
+        finally:
+            self.pending -= 1
+
+@upstream_call('translate')
+async def translate_upstream_async(texts: list, source: str, target: str) -> list:
+    async with _aio['limits']['translate'].slot():
+        return await translator.translate_async(_aio['session'], texts, source, target)
+
+@timed_stage('translate')
+async def translate_text_async(text: str, source: str, target: str) -> str:
+    validate_translate_langs(source, target)
+    plan = await _blocking(tm_plan, text, source, target)
+    missing = plan[3]
+    translated = []
+    if missing:
+        pieces, owners, chunks = split_for_upstream(list(missing.values()))
+        results = await asyncio.gather(*(translate_upstream_async([pieces[i] for i in chunk], source, target)
+                                         for chunk in chunks))
+        translated = join_from_upstream(len(missing), owners, (t for result in results for t in result))
+    return await _blocking(tm_finish, plan, translated, source, target)
+
+@upstream_call('tts')
+async def synthesize_segment_async(text: str, lang: str) -> bytes:
+    tts = gTTS(text=text, lang=lang)
+    audio = []
+    for pr in tts_requests(tts):
+        headers = {k: v for k, v in pr.headers.items() if k.lower() != 'content-length'}
+        async with _aio['limits']['tts'].slot():
+            try:
+                async with _aio['session'].post(pr.url, data=pr.body, headers=headers,
+                                                timeout=aiohttp.ClientTimeout(total=TTS_TIMEOUT)) as r:
+                    r.raise_for_status()
+                    body = await r.text()
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                raise gTTSError(tts=tts)
+        audio.append(tts_frames(tts, body))
+    return b"".join(audio)
+
+async def _copy_to_file(stream, f):
+    while True:
+        data = await stream.read(64 * 1024)
+        if not data:
+            return
+        await _blocking(f.write, data)
+
+async def _stderr_tail(stream) -> str:
+    """Read a subprocess's stderr to the end alongside its stdout, keeping the last few KB."""
+    tail = bytearray()
+    while True:
+        data = await stream.read(4096)
+        if not data:
+            return tail.decode(errors='replace').strip()
+        tail.extend(data)
+        del tail[:-4096]
+
+@timed_stage('tts')
+async def tts_to_tempfile_async(text: str, lang: str, fmt: str = 'mp3') -> str:
+    _, keys, cached, missing = await _blocking(plan_tts, limit_text(text), lang)
+    tasks = {key: asyncio.ensure_future(synthesize_segment_async(segment, lang)) for key, segment in missing.items()}
+    fresh = {}
+    tf = scratch.file(f".{AUDIO_FORMATS[fmt][0]}")
+    command, proc = transcoder_command(fmt), None
+    try:
+        if command:
+            proc = await asyncio.create_subprocess_exec(*command, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                                        stderr=subprocess.PIPE)
+            encoded = asyncio.ensure_future(_copy_to_file(proc.stdout, tf))
+            stderr = asyncio.ensure_future(_stderr_tail(proc.stderr))
+        for key in keys:
+            if key not in cached:
+                cached[key] = fresh[key] = await tasks[key]
+            if proc:
+                proc.stdin.write(cached[key])
+                await proc.stdin.drain()
+            else:
+                await _blocking(tf.write, cached[key])
+        if proc:
+            proc.stdin.close()
+            await encoded
+            error = await stderr
+            if await proc.wait() != 0:
+                raise ValueError(f"Audio encoding failed: {error}")
+    except BaseException:
+        for task in tasks.values():
+            task.cancel()
+        if proc:
+            encoded.cancel()
+            stderr.cancel()
+            if proc.returncode is None:
+                proc.kill()
+        scratch.release(tf.name)
+        raise
+    finally:
+        if fresh:
+            await _blocking(tts_cache_store, fresh)
+    tf.close()
+    return tf.name
+
+@upstream_call('stt')
+async def recognize_segment_async(pcm: bytes, language: str) -> str:
+    builder = sr_google.create_request_builder(endpoint=STT_ENDPOINT, language=language)
+    req = await _blocking(builder.build, sr.AudioData(pcm, STT_SAMPLE_RATE, 2))  # runs flac
+    async with _aio['limits']['stt'].slot():
+        try:
+            async with _aio['session'].post(req.full_url, data=req.data, headers=dict(req.header_items()),
+                                            timeout=aiohttp.ClientTimeout(total=STT_TIMEOUT)) as r:
+                if r.status != 200:
+                    raise ValueError(f"Speech service error: recognition request failed: {r.reason}")
+                body = await r.text()
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            raise ValueError(f"Speech service error: recognition connection failed: {e}")
+    try:
+        return sr_google.OutputParser(show_all=False, with_confidence=False).parse(body)
+    except sr.UnknownValueError:
+        return ""
+
+@timed_stage('stt')
+async def stt_google_async(pcm: bytes, language: str = 'en') -> str:
+    language = validate_stt_lang(language).split('-')[0]
+    segments = await _blocking(split_on_silence, pcm)
+    texts = await asyncio.gather(*(recognize_segment_async(segment, language) for segment in segments))
+    text = " ".join(t for t in texts if t)
+    if not text:
+        raise ValueError("Could not understand the audio.")
+    return text
+
+async def run_pdf_to_translate_async(pdf, params) -> dict:
+    target = params.get('lang', 'en')
+    text = await _blocking(extract_upload_in_pool, pdf)
+    return {"translated_text": await translate_text_async(text, params.get('source', 'en'), target)}
+
+async def run_audio_to_translate_async(audio, params) -> dict:
+    stt_lang = params.get('stt_lang', 'en')
+    target = params.get('lang', 'en')
+    check_file_size(audio)
+    pcm = await _blocking(decode_in_pool, audio)
+    text = await stt_google_async(pcm, language=stt_lang)
+    return {"text": text, "translated_text": await translate_text_async(text, stt_lang.split('-')[0], target)}
+
+async def run_audio_to_audio_async(audio, params) -> str:
+    translated = (await run_audio_to_translate_async(audio, params))["translated_text"]
+    return await tts_to_tempfile_async(translated, params.get('lang', 'en'), output_format(params))
+
+# route -> (mode, pipeline)
+AIO_ROUTES = {
+    '/pdf-to-translate': ('pdf_translate', run_pdf_to_translate_async),
+    '/audio-to-translate': ('audio_translate', run_audio_to_translate_async),
+    '/audio-to-audio': ('audio_audio', run_audio_to_audio_async),
+}
+
+async def _compute_and_cache(key: str, compute):
+    return await _blocking(cache_put, key, await compute())
+
+async def cached_result_async(key: str, mode: str, compute):
+    # Same cache as cached_result(); duplicates coalesce on the loop's own task. The
+    # task is shielded so one client hanging up doesn't cancel it for the others.
+    cached = await _blocking(cache_get, key)
+    inc('pdfai_result_cache_requests_total', result='miss' if cached is None else 'hit')
+    if cached is not None:
+        return cached
+    admit_stages(PIPELINES[mode][1], _aio['limits'])
+    task = _aio_inflight.get(key)
+    if task is None:
+        task = _aio_inflight[key] = asyncio.ensure_future(_compute_and_cache(key, compute))
+        task.add_done_callback(lambda _: _aio_inflight.pop(key, None))
+    else:
+        inc('pdfai_coalesced_requests_total', mode=mode, scope='thread')
+    return await asyncio.shield(task)
+
+async def aio_convert(request):
+    mode, pipeline = AIO_ROUTES[request.path]
+    field, download_name = PIPELINES[mode][0], PIPELINES[mode][3]
+    try:
+        form = await request.post()
+        upload = form.get(field)
+        if not isinstance(upload, web.FileField):
+            return web.Response(status=400, text=f"No {field} uploaded")
+        params = {k: v for k, v in form.items() if isinstance(v, str)}
+        upload_hash = await _blocking(hash_upload, upload.file)
+        key = result_cache_key(upload_hash, mode, params)
+        result = await cached_result_async(key, mode, lambda: pipeline(upload.file, params))
+    except web.HTTPException:
+        raise
+    except Overloaded as e:
+        return web.Response(status=429, text=str(e), headers={'Retry-After': str(e.retry_after)})
+    except Exception as e:
+        logging.error(f"{mode} error: {str(e)}")
+        return web.Response(status=400, text=str(e))
+    if download_name is None:
+        return web.json_response(result)
+    ext = os.path.splitext(result)[1][1:]
+    return web.FileResponse(result, headers={'Content-Type': AUDIO_MIMETYPES[ext],
+                                             'Content-Disposition': f'attachment; filename="{os.path.splitext(download_name)[0]}.{ext}"',
+                                             'Content-Location': f"/results/{os.path.basename(result)}"})
+
+async def aio_result(request):
+    # FileResponse answers Range and If-None-Match itself.
+    key, ext = request.match_info['key'], request.match_info['ext']
+    if not re.fullmatch(r'[0-9a-f]{64}', key) or ext not in AUDIO_MIMETYPES:
+        return web.Response(status=404, text="Result not found")
+    audio_path = _result_path(key, ext)
+    if not os.path.exists(audio_path):
+        return web.Response(status=404, text="Result not found")
+    return web.FileResponse(audio_path, headers={
+        'Content-Type': AUDIO_MIMETYPES[ext], 'Cache-Control': f'public, max-age={RESULT_MAX_AGE}, immutable'})
+
+async def aio_metrics(request):
+    return web.Response(text=render_metrics(), headers={'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'})
+
+async def _aio_upstreams(aio):
+    _aio['session'] = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=AIO_UPSTREAM_CONNECTIONS))
+    _aio['limits'] = {name: AioUpstreamLimit(name, AIO_UPSTREAM_CONCURRENCY) for name in ('translate', 'tts', 'stt')}
+    yield
+    await _aio['session'].close()
+
+def make_aio_app():
+    @web.middleware
+    async def request_metrics(request, handler):
+        resource = request.match_info.route.resource
+        route = resource.canonical if resource is not None else 'unmatched'
+        inc('pdfai_requests_in_flight', route=route)
+        start, status = time.perf_counter(), 500
+        try:
+            response = await handler(request)
+            status = response.status
+            return response
+        except web.HTTPException as e:
+            status = e.status
+            raise
+        finally:
+            inc('pdfai_requests_in_flight', -1, route=route)
+            observe('pdfai_request_seconds', time.perf_counter() - start, route=route, method=request.method, status=status)
+
+    aio = web.Application(client_max_size=app.config['MAX_CONTENT_LENGTH'], middlewares=[request_metrics])
+    aio.cleanup_ctx.append(_aio_upstreams)
+    for path in AIO_ROUTES:
+        aio.router.add_post(path, aio_convert)
+    aio.router.add_get('/results/{key}.{ext}', aio_result)
+    aio.router.add_get('/metrics', aio_metrics)
+    return aio
+
+aio_app = make_aio_app() if web is not None else None
+
+# ---------- Index page ----------
+# The landing page only changes with the language list, so it is rendered and
+# compressed once per registry update and then served from memory.
+SELECT_CLASSES = 'class="w-full rounded-xl bg-slate-900/60 border border-white/10 px-4 py-3 focus:outline-none focus:ring-2 focus:ring-brand-400">'
+_index_page = {'languages': None}
+
+def render_index_page(langs: list) -> dict:
+    lang_options = "".join(f'<option value="{escape(lang["code"])}">{escape(lang["code"])} ({escape(lang.get("name", lang["code"]))})</option>'
+                           for lang in langs)
+    html = INDEX_HTML
+    for select_id in ('lang', 'stt_lang'):
+        tag = f'<select id="{select_id}" name="{select_id}" {SELECT_CLASSES}'
+        html = html.replace(tag, tag + lang_options)
+    body = html.encode('utf-8')
+    page = {'languages': langs, 'identity': body, 'gzip': gzip.compress(body, 9),
+            'etag': hashlib.sha256(body).hexdigest()[:32]}
+    if brotli is not None:
+        page['br'] = brotli.compress(body, quality=11)
+    return page
+
+def get_index_page() -> dict:
+    global _index_page
+    current = languages
+    if _index_page['languages'] is not current:
+        _index_page = render_index_page(current)
+    return _index_page
 
 # ---------- Routes ----------
+def _route_label() -> str:
+    return request.url_rule.rule if request.url_rule else 'unmatched'
+
+def _count_streamed_bytes(route: str, chunks):
+    try:
+        for chunk in chunks:
+            inc('pdfai_response_bytes_total', len(chunk), route=route)
+            yield chunk
+    finally:
+        if hasattr(chunks, 'close'):
+            chunks.close()
+
+@app.before_request
+def start_request_metrics():
+    route = _route_label()
+    request.environ['pdfai.metrics'] = {'route': route, 'method': request.method, 'status': 500,
+                                        'start': time.perf_counter()}
+    inc('pdfai_requests_in_flight', route=route)
+    if request.content_length:
+        inc('pdfai_request_bytes_total', request.content_length, route=route)
+
+@app.after_request
+def record_response_metrics(response):
+    state = request.environ.get('pdfai.metrics')
+    if state:
+        state['status'] = response.status_code
+        if response.content_length is not None:
+            inc('pdfai_response_bytes_total', response.content_length, route=state['route'])
+        elif response.is_streamed:
+            response.response = _count_streamed_bytes(state['route'], response.response)
+    return response
+
+def finish_request_metrics(wsgi_app):
+    # The server closes the response iterable once the whole body has been sent, so
+    # latency and in-flight counts cover streamed and file responses end to end.
+    def middleware(environ, start_response):
+        def finish():
+            state = environ.get('pdfai.metrics')
+            if state:
+                inc('pdfai_requests_in_flight', -1, route=state['route'])
+                observe('pdfai_request_seconds', time.perf_counter() - state['start'],
+                        route=state['route'], method=state['method'], status=state['status'])
+        return ClosingIterator(wsgi_app(environ, start_response), finish)
+    return middleware
+
+app.wsgi_app = finish_request_metrics(app.wsgi_app)
+
+def release_request_scratch(wsgi_app):
+    # Scratch files made while handling or streaming a request are deleted once the
+    # server closes the response, including after errors and client disconnects.
+    def middleware(environ, start_response):
+        scope = scratch.scope()
+        scope.__enter__()
+        try:
+            return ClosingIterator(wsgi_app(environ, start_response), lambda: scope.__exit__(None, None, None))
+        except BaseException:
+            scope.__exit__(*sys.exc_info())
+            raise
+    return middleware
+
+app.wsgi_app = release_request_scratch(app.wsgi_app)
+
+@app.before_request
+def reject_oversized_uploads():
+    # Refuse on the declared length before reading any of the body, then parse the
+    # form here so UploadBuffer can cut off uploads that turn out to be too large.
+    if request.endpoint == 'batch':
+        request.max_file_size = BATCH_MAX_BYTES
+        request.max_content_length = BATCH_MAX_BYTES + 64 * 1024
+    if request.content_length and request.content_length > request.max_content_length:
+        return f"File size exceeds {request.max_file_size / 1024 / 1024}MB limit", 413
+    if request.method == 'POST':
+        request.files
+
+@app.errorhandler(RequestEntityTooLarge)
+def upload_too_large(e):
+    return e.description, 413
+
+@app.errorhandler(Overloaded)
+def upstream_overloaded(e):
+    logging.warning(f"Shedding {request.path}: {e}")
+    return str(e), 429, {'Retry-After': str(e.retry_after)}
+
 @app.route('/')
 def index():
-    lang_options = "".join([f'<option value="{lang}">{lang} ({name})</option>' for lang in VALID_STT_LANGS for name in [next((l['name'] for l in languages if l['code'] == lang), lang)]])
-    html = INDEX_HTML.replace(
-        '<select id="lang" name="lang" class="w-full rounded-xl bg-slate-900/60 border border-white/10 px-4 py-3 focus:outline-none focus:ring-2 focus:ring-brand-400">',
-        f'<select id="lang" name="lang" class="w-full rounded-xl bg-slate-900/60 border border-white/10 px-4 py-3 focus:outline-none focus:ring-2 focus:ring-brand-400">{lang_options}</select>'
-    ).replace(
-        '<select id="stt_lang" name="stt_lang" class="w-full rounded-xl bg-slate-900/60 border border-white/10 px-4 py-3 focus:outline-none focus:ring-2 focus:ring-brand-400">',
-        f'<select id="stt_lang" name="stt_lang" class="w-full rounded-xl bg-slate-900/60 border border-white/10 px-4 py-3 focus:outline-none focus:ring-2 focus:ring-brand-400">{lang_options}</select>'
-    )
-    return render_template_string(html)
+    page = get_index_page()
+    encoding = next((e for e in ('br', 'gzip') if e in page and e in request.accept_encodings), None)
+    response = Response(page[encoding] if encoding else page['identity'], mimetype='text/html')
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.headers['Vary'] = 'Accept-Encoding'
+    response.headers['Cache-Control'] = f'public, max-age={INDEX_MAX_AGE}'
+    response.set_etag(f"{page['etag']}-{encoding}" if encoding else page['etag'])
+    return response.make_conditional(request)
 
 @app.route('/pdf-to-audio', methods=['POST'])
 def pdf_to_audio():
     try:
         pdf = request.files.get('pdf')
-        lang = request.form.get('lang', 'en')
+        if 'document_id' in request.form:
+            document = load_document(request.form['document_id'])
+            if not document:
+                return "Document not found", 404
+            return send_audio(run_document('pdf_audio', document, request.form), 'audiobook.mp3')
         if not pdf:
             return "No PDF uploaded", 400
-        text = extract_text_from_pdf(pdf)
-        mp3_path = tts_to_tempfile(text, lang)
-
-        @after_this_request
-        def cleanup(response):
-            try:
-                os.remove(mp3_path)
-            except Exception as e:
-                logging.error(f"Failed to delete temp file {mp3_path}: {e}")
-            return response
+        audio_path = run_pipeline('pdf_audio', pdf, request.form)
+        return send_audio(audio_path, 'audiobook.mp3')
+    except Overloaded:
+        raise
+    except Exception as e:
+        return str(e), 400
 
-        return send_file(mp3_path, mimetype='audio/mpeg', as_attachment=True, download_name='audiobook.mp3')
+@app.route('/pdf-to-audio/stream', methods=['POST'])
+def pdf_to_audio_stream():
+    try:
+        pdf = request.files.get('pdf')
+        lang = request.form.get('lang', 'en')
+        if not pdf:
+            return "No PDF uploaded", 400
+        key = result_cache_key(hash_upload(check_file_size(pdf)), 'pdf_audio_stream', request.form)
+        cached = cache_get(key)
+        if cached is not None:
+            return send_audio(cached, 'audiobook.mp3', as_attachment=False)
+        admit_stages(['tts'])
+        fmt = output_format(request.form)
+        ext = AUDIO_FORMATS[fmt][0]
+        buffer = spool_upload(pdf)
+        try:
+            chunks = cache_stream(key, transcode(stream_pdf_audio(open_pdf(buffer), lang), fmt), ext)
+        except Exception:
+            buffer.close()
+            raise
+        # No Content-Length, so the audio goes out as a chunked response while later pages are still being read.
+        response = Response(stream_with_context(chunks), mimetype=AUDIO_MIMETYPES[ext],
+                            headers={'Content-Disposition': f'inline; filename=audiobook.{ext}'})
+        response.call_on_close(buffer.close)
+        return response
+    except Overloaded:
+        raise
     except Exception as e:
         return str(e), 400
 
@@ -156,55 +2457,48 @@ def pdf_to_audio():
 def pdf_to_translate():
     try:
         pdf = request.files.get('pdf')
-        target = request.form.get('lang', 'en')
+        if 'document_id' in request.form:
+            document = load_document(request.form['document_id'])
+            if not document:
+                return "Document not found", 404
+            return jsonify(run_document('pdf_translate', document, request.form))
         if not pdf:
             return "No PDF uploaded", 400
-        text = extract_text_from_pdf(pdf)
-        logging.info(f"Translating text: '{text[:50]}...' (len={len(text)}) to {target}")
-        logging.info(f"Full text for debug: {text}")
-        translated = lt.translate(text, 'en', target)  # Explicit source 'en'
-        return jsonify({"translated_text": translated})
+        return jsonify(run_pipeline('pdf_translate', pdf, request.form))
+    except Overloaded:
+        raise
     except Exception as e:
-        logging.error(f"Translation error: {str(e)} - Text: '{text[:50]}...' (len={len(text)}) Target: {target}")
+        logging.error(f"Translation error: {str(e)} - Target: {request.form.get('lang', 'en')}")
         return str(e), 400
 
 @app.route('/pdf-to-translate-audio', methods=['POST'])
 def pdf_to_translate_audio():
     try:
         pdf = request.files.get('pdf')
-        target = request.form.get('lang', 'en')
+        if 'document_id' in request.form:
+            document = load_document(request.form['document_id'])
+            if not document:
+                return "Document not found", 404
+            return send_audio(run_document('pdf_translate_audio', document, request.form), 'translated_audiobook.mp3')
         if not pdf:
             return "No PDF uploaded", 400
-        text = extract_text_from_pdf(pdf)
-        logging.info(f"Translating text: '{text[:50]}...' (len={len(text)}) to {target}")
-        translated = lt.translate(text, 'en', target)  # Explicit source 'en'
-        mp3_path = tts_to_tempfile(translated, target)
-
-        @after_this_request
-        def cleanup(response):
-            try:
-                os.remove(mp3_path)
-            except Exception as e:
-                logging.error(f"Failed to delete temp file {mp3_path}: {e}")
-            return response
-
-        return send_file(mp3_path, mimetype='audio/mpeg', as_attachment=True, download_name='translated_audiobook.mp3')
+        audio_path = run_pipeline('pdf_translate_audio', pdf, request.form)
+        return send_audio(audio_path, 'translated_audiobook.mp3')
+    except Overloaded:
+        raise
     except Exception as e:
-        logging.error(f"Translation error: {str(e)} - Text: '{text[:50]}...' (len={len(text)}) Target: {target}")
+        logging.error(f"Translation error: {str(e)} - Target: {request.form.get('lang', 'en')}")
         return str(e), 400
 
 @app.route('/audio-to-text', methods=['POST'])
 def audio_to_text():
     try:
         audio = request.files.get('audio')
-        stt_lang = request.form.get('stt_lang', 'en')
         if not audio:
             return "No audio uploaded", 400
-        check_file_size(audio)
-        wav_path = convert_to_wav(audio)
-        text = stt_google(wav_path, language=stt_lang)
-        os.remove(wav_path)  # Clean up
-        return jsonify({"text": text})
+        return jsonify(run_pipeline('audio_text', audio, request.form))
+    except Overloaded:
+        raise
     except Exception as e:
         return str(e), 400
 
@@ -212,50 +2506,188 @@ def audio_to_text():
 def audio_to_translate():
     try:
         audio = request.files.get('audio')
-        stt_lang = request.form.get('stt_lang', 'en')
-        target = request.form.get('lang', 'en')
         if not audio:
             return "No audio uploaded", 400
-        check_file_size(audio)
-        wav_path = convert_to_wav(audio)
-        text = stt_google(wav_path, language=stt_lang)
-        os.remove(wav_path)  # Clean up
-        logging.info(f"Translating text: '{text[:50]}...' (len={len(text)}) to {target}")
-        translated = lt.translate(text, stt_lang.split('-')[0], target)
-        return jsonify({"text": text, "translated_text": translated})
+        return jsonify(run_pipeline('audio_translate', audio, request.form))
+    except Overloaded:
+        raise
     except Exception as e:
-        logging.error(f"Translation error: {str(e)} - Text: '{text[:50]}...' (len={len(text)}) Target: {target}")
+        logging.error(f"Translation error: {str(e)} - Target: {request.form.get('lang', 'en')}")
         return str(e), 400
 
 @app.route('/audio-to-audio', methods=['POST'])
 def audio_to_audio():
     try:
         audio = request.files.get('audio')
-        stt_lang = request.form.get('stt_lang', 'en')
-        target_lang = request.form.get('lang', 'en')
         if not audio:
             return "No audio uploaded", 400
-        check_file_size(audio)
-        wav_path = convert_to_wav(audio)
-        text = stt_google(wav_path, language=stt_lang)
-        os.remove(wav_path)  # Clean up
-        logging.info(f"Translating text: '{text[:50]}...' (len={len(text)}) to {target_lang}")
-        translated = lt.translate(text, stt_lang.split('-')[0], target_lang)
-        mp3_path = tts_to_tempfile(translated, target_lang)
-
-        @after_this_request
-        def cleanup(response):
-            try:
-                os.remove(mp3_path)
-            except Exception as e:
-                logging.error(f"Failed to delete temp file {mp3_path}: {e}")
-            return response
+        audio_path = run_pipeline('audio_audio', audio, request.form)
+        return send_audio(audio_path, 'translated_audio.mp3')
+    except Overloaded:
+        raise
+    except Exception as e:
+        logging.error(f"Translation error: {str(e)} - Target: {request.form.get('lang', 'en')}")
+        return str(e), 400
 
-        return send_file(mp3_path, mimetype='audio/mpeg', as_attachment=True, download_name='translated_audio.mp3')
+@app.route('/audio-to-audio/stream', methods=['POST'])
+def audio_to_audio_stream():
+    try:
+        audio = request.files.get('audio')
+        if not audio:
+            return "No audio uploaded", 400
+        key = result_cache_key(hash_upload(check_file_size(audio)), 'audio_audio_stream', request.form)
+        cached = cache_get(key)
+        if cached is not None:
+            return send_audio(cached, 'translated_audio.mp3', as_attachment=False)
+        admit_stages(['stt', 'translate', 'tts'])
+        fmt = output_format(request.form)
+        ext = AUDIO_FORMATS[fmt][0]
+        frames, cancel = stream_audio_to_audio(decode_in_pool(audio), request.form)
+        try:
+            chunks = cache_stream(key, transcode(frames, fmt), ext)
+            # Chunked, so each translated segment goes out while later ones are still being recognized.
+            response = Response(stream_with_context(chunks), mimetype=AUDIO_MIMETYPES[ext],
+                                headers={'Content-Disposition': f'inline; filename=translated_audio.{ext}'})
+        except Exception:
+            cancel()
+            raise
+        # The server always closes the response, even if the body was never iterated, so
+        # the stages stop and release the clip however the request ends.
+        response.call_on_close(cancel)
+        return response
+    except Overloaded:
+        raise
+    except Exception as e:
+        logging.error(f"Translation error: {str(e)} - Target: {request.form.get('lang', 'en')}")
+        return str(e), 400
+
+@app.route('/results/<key>.<ext>', methods=['GET'])
+def get_result(key, ext):
+    # Keys are derived from the upload and the conversion, so a URL's content never
+    # changes and browsers may keep it; Range requests make seeking a partial read.
+    if not re.fullmatch(r'[0-9a-f]{64}', key) or ext not in AUDIO_MIMETYPES:
+        return "Result not found", 404
+    audio_path = _result_path(key, ext)
+    if not os.path.exists(audio_path):
+        return "Result not found", 404
+    response = send_file(audio_path, mimetype=AUDIO_MIMETYPES[ext], etag=result_etag(audio_path),
+                         max_age=RESULT_MAX_AGE, conditional=True)
+    response.cache_control.immutable = True
+    return response
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/translation-memory/stats', methods=['GET'])
+def translation_memory_stats():
+    with tm_stats_lock:
+        stats = dict(tm_stats)
+    lookups = stats['hits'] + stats['misses']
+    stats['hit_rate'] = round(stats['hits'] / lookups, 4) if lookups else None
+    stats['entries'] = _tm_conn().execute('SELECT COUNT(*) FROM segments').fetchone()[0]
+    return jsonify(stats)
+
+@app.route('/batch', methods=['POST'])
+def batch():
+    # Text results stream back as NDJSON, one line per document; audio results as a ZIP of MP3s.
+    # The documents are scratch files of this request, so they go once the response is closed.
+    try:
+        mode = request.form.get('mode', 'pdf_translate')
+        if mode not in BATCH_MODES:
+            return f"Unknown mode: {mode}. Expected one of {', '.join(BATCH_MODES)}", 400
+        admit_stages(PIPELINES[mode][1])
+        documents = collect_batch_documents(request.files.getlist('pdf') + request.files.getlist('zip'))
+        results = run_batch(documents, mode, request.form.to_dict())
+        if PIPELINES[mode][3] is None:
+            return Response(batch_ndjson(results), mimetype='application/x-ndjson')
+        return Response(batch_zip(results), mimetype='application/zip',
+                        headers={'Content-Disposition': 'attachment; filename=batch.zip'})
+    except Overloaded:
+        raise
+    except Exception as e:
+        logging.error(f"Batch error: {str(e)}")
+        return str(e), 400
+
+@app.route('/documents', methods=['POST'])
+def submit_document():
+    try:
+        pdf = request.files.get('pdf')
+        if not pdf:
+            return "No PDF uploaded", 400
+        return jsonify(document_status(create_document(pdf))), 201
+    except Overloaded:
+        raise
     except Exception as e:
-        logging.error(f"Translation error: {str(e)} - Text: '{text[:50]}...' (len={len(text)}) Target: {target_lang}")
         return str(e), 400
 
+@app.route('/documents/<document_id>', methods=['GET'])
+def get_document(document_id):
+    document = load_document(document_id)
+    if not document:
+        return "Document not found", 404
+    return jsonify(document_status(document))
+
+@app.route('/documents/<document_id>', methods=['DELETE'])
+def delete_document(document_id):
+    if not load_document(document_id):
+        return "Document not found", 404
+    try:
+        os.remove(_document_path(document_id))
+    except OSError:
+        pass
+    return "", 204
+
+@app.route('/jobs', methods=['POST'])
+def submit_job():
+    try:
+        mode = request.form.get('mode', '')
+        if mode not in PIPELINES:
+            return f"Unknown mode: {mode}. Expected one of {', '.join(PIPELINES)}", 400
+        field = PIPELINES[mode][0]
+        upload = request.files.get(field)
+        if not upload:
+            return f"No {field} uploaded", 400
+        check_file_size(upload)
+        admit_stages(PIPELINES[mode][1])
+
+        buffer = spool_upload(upload)
+
+        reap_expired(JOBS_DIR, JOB_TTL)
+        fmt = output_format(request.form) if has_audio_result(mode) else None
+        job = {'id': uuid.uuid4().hex, 'mode': mode, 'format': fmt, 'status': 'queued',
+               'stage': None, 'progress': 0.0, 'error': None, 'result': None, 'created': time.time(), 'finished': None}
+        _write_json_atomic(_job_path(job['id']), job)
+        job_executor.submit(run_job, dict(job), buffer, request.form.to_dict())
+        return jsonify(job_status(job)), 202
+    except Overloaded:
+        raise
+    except Exception as e:
+        return str(e), 400
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    job = load_job(job_id)
+    if not job:
+        return "Job not found", 404
+    return jsonify(job_status(job))
+
+@app.route('/jobs/<job_id>/result', methods=['GET'])
+def get_job_result(job_id):
+    job = load_job(job_id)
+    if not job:
+        return "Job not found", 404
+    if job['status'] == 'failed':
+        return job['error'], 400
+    if job['status'] != 'done':
+        return jsonify(job_status(job)), 409
+    download_name = PIPELINES[job['mode']][3]
+    if download_name:
+        ext = AUDIO_FORMATS[job.get('format', 'mp3')][0]
+        return send_file(_job_path(job_id, ext), mimetype=AUDIO_MIMETYPES[ext], as_attachment=True,
+                         download_name=f"{os.path.splitext(download_name)[0]}.{ext}")
+    return jsonify(job['result'])
+
 # HTML content
 INDEX_HTML = """
 <!DOCTYPE html>
@@ -286,7 +2718,7 @@ INDEX_HTML = """
 </head>
 <body class="animated-bg min-h-screen text-slate-100 flex flex-col">
   <header class="w-full"><div class="mx-auto max-w-6xl px-4 py-5 flex items-center justify-between"><a href="#" class="flex items-center gap-3 group"><div class="h-10 w-10 rounded-xl p-[2px] shadow-lg" style="background:linear-gradient(135deg,var(--logo-grad-1),var(--logo-grad-2))"><div class="h-full w-full rounded-[10px] bg-slate-900/70 grid place-items-center"><svg width="22" height="22" viewBox="0 0 24 24" fill="none" stroke="white" stroke-width="1.8" stroke-linecap="round" stroke-linejoin="round" class="opacity-95"><path d="M14 2H6a2 2 0 0 0-2 2v16a2 2 0 0 0 2 2h12a2 2 0 0 0 2-2V8z"/><path d="M14 2v6h6"/><path d="M8 16c1.5-2 2.5 2 4 0s2.5-2 4 0"/></svg></div></div><div><div class="text-xl font-extrabold tracking-tight leading-5">PDF&nbsp;AI</div><div class="text-xs text-slate-300/80 -mt-0.5">Transform • Translate • Speak</div></div></a><div class="hidden md:flex items-center gap-2"><span class="brand-chip text-xs font-semibold text-white px-3 py-1.5 rounded-full shadow">AI Powered</span><span class="text-sm text-slate-300">20+ Languages</span></div></div></header>
-  <section class="mx-auto max-w-6xl px-4 pb-6"><div class="grid lg:grid-cols-2 gap-6 items-stretch"><div class="glass rounded-2xl shadow-glass p-6 md:p-8 flex flex-col justify-center"><h1 class="text-3xl md:text-4xl font-extrabold leading-tight">Transform documents & audio with<span class="bg-clip-text text-transparent" style="background-image:linear-gradient(90deg,var(--logo-grad-1),var(--logo-grad-2))">real‑time AI</span></h1><p class="mt-3 text-slate-200/90">Extract, translate, and convert between text and speech in a single, elegant tool. Fast. Accurate. Private.</p><ul class="mt-5 space-y-2 text-sm text-slate-200/90"><li class="flex items-start gap-3"><svg width="18" height="18" viewBox="0 0 24 24" fill="none" stroke="currentColor" stroke-width="2" class="mt-0.5 text-brand-300"><path d="M20 6L9 17l-5-5"/></svg>PDF text extraction with OCR-ready pipeline</li><li class="flex items-start gap-3"><svg width="18" height="18" viewBox="0 0 24 24" fill="none" stroke="currentColor" stroke-width="2" class="mt-0.5 text-brand-300"><path d="M20 6L9 17l-5-5"/></svg>Multi‑language translation</li><li class="flex items-start gap-3"><svg width="18" height="18" viewBox="0 0 24 24" fill="none" stroke="currentColor" stroke-width="2" class="mt-0.5 text-brand-300"><path d="M20 6L9 17l-5-5"/></svg>Natural‑sounding text‑to‑speech</li><li class="flex items-start gap-3"><svg width="18" height="18" viewBox="0 0 24 24" fill="none" stroke="currentColor" stroke-width="2" class="mt-0.5 text-brand-300"><path d="M20 6L9 17l-5-5"/></svg>Accurate speech recognition</li></ul></div><div class="glass rounded-2xl shadow-glass p-6 md:p-8"><form id="toolForm" class="space-y-5" enctype="multipart/form-data"><div><label class="block text-sm font-semibold mb-2" for="mode">Processing Mode</label><div class="relative"><select id="mode" name="mode" class="w-full appearance-none rounded-xl bg-slate-900/60 border border-white/10 px-4 py-3 pr-10 focus:outline-none focus:ring-2 focus:ring-brand-400"><option value="pdf_audio">PDF → Audio • Convert PDF text to speech</option><option value="pdf_translate">PDF → Translate • Extract & translate text</option><option value="pdf_translate_audio">PDF → Translate → Audio • Translate then speech</option><option value="audio_text">Audio → Text • Speech to text</option><option value="audio_translate">Audio → Translate • STT and translate</option><option value="audio_audio">Audio → Audio • Speak back in target language</option></select><div class="pointer-events-none absolute inset-y-0 right-0 flex items-center pr-3"><svg width="18" height="18" viewBox="0 0 24 24" fill="none" stroke="currentColor" stroke-width="2" class="text-slate-300"><path d="M6 9l6 6 6-6"/></svg></div></div></div><div><label class="block text-sm font-semibold mb-2" for="lang">Target Language</label><select id="lang" name="lang" class="w-full rounded-xl bg-slate-900/60 border border-white/10 px-4 py-3 focus:outline-none focus:ring-2 focus:ring-brand-400"></select></div><div id="pdfInput"><label class="block text-sm font-semibold mb-2" for="pdf">1. Upload PDF</label><label class="group flex items-center justify-between gap-4 rounded-xl border border-dashed border-white/15 bg-slate-900/50 p-4 hover:border-brand-300 cursor-pointer"><div class="flex items-center gap-3"><div class="rounded-lg p-2" style="background:linear-gradient(90deg,var(--logo-grad-1),var(--logo-grad-2))"><svg width="18" height="18" viewBox="0 0 24 24" fill="none" stroke="white" stroke-width="2"><path d="M21 15v4a2 2 0 0 1-2 2H5a2 2 0 0 1-2-2v-4"/><polyline points="17 8 12 3 7 8"/><line x1="12" y1="3" x2="12" y2="15"/></svg></div><div><div class="text-sm font-semibold">Drag & drop your PDF here</div><div class="text-xs text-slate-300">or click to browse • Max 10MB</div></div></div><input id="pdf" name="pdf" type="file" accept="application/pdf" class="sr-only" /><span id="pdfName" class="text-xs text-slate-300">No file chosen</span></label></div><div id="audioInput" class="hidden"><label class="block text-sm font-semibold mb-2" for="audio">1. Upload Audio</label><label class="group flex items-center justify-between gap-4 rounded-xl border border-dashed border-white/15 bg-slate-900/50 p-4 hover:border-brand-300 cursor-pointer"><div class="flex items-center gap-3"><div class="rounded-lg p-2" style="background:linear-gradient(90deg,var(--logo-grad-1),var(--logo-grad-2))"><svg width="18" height="18" viewBox="0 0 24 24" fill="none" stroke="white" stroke-width="2"><path d="M12 1v11"/><path d="M5 10a7 7 0 0 0 14 0"/><path d="M8 21h8"/></svg></div><div><div class="text-sm font-semibold">Drag & drop your audio</div><div class="text-xs text-slate-300">MP3, WAV, M4A, OGG • Max 10MB</div></div></div><input id="audio" name="audio" type="file" accept="audio/*" class="sr-only" /><span id="audioName" class="text-xs text-slate-300">No file chosen</span></label></div><div id="sttLangRow" class="hidden"><label for="stt_lang" class="block text-sm font-semibold mb-2">Speech Language (for STT)</label><select id="stt_lang" name="stt_lang" class="w-full rounded-xl bg-slate-900/60 border border-white/10 px-4 py-3 focus:outline-none focus:ring-2 focus:ring-brand-400"></select></div><button type="submit" class="btn-primary w-full rounded-xl py-3.5 font-semibold text-white shadow-lg active:scale-[.99] transition">2. Start Processing</button><div id="progressWrap" class="hidden h-2 w-full overflow-hidden rounded bg-white/10"><div class="h-full w-0 bg-white/60 animate-[loader_2s_ease_infinite]"></div></div><style>@keyframes loader{0%{width:0}50%{width:80%}100%{width:100%}}</style><div class="space-y-3 pt-2"><audio id="player" class="hidden w-full" controls></audio><textarea id="outputText" class="hidden w-full min-h-[140px] rounded-xl bg-slate-900/60 border border-white/10 p-3 text-sm" placeholder="Results will appear here"></textarea></div></form></div></div></section>
+  <section class="mx-auto max-w-6xl px-4 pb-6"><div class="grid lg:grid-cols-2 gap-6 items-stretch"><div class="glass rounded-2xl shadow-glass p-6 md:p-8 flex flex-col justify-center"><h1 class="text-3xl md:text-4xl font-extrabold leading-tight">Transform documents & audio with<span class="bg-clip-text text-transparent" style="background-image:linear-gradient(90deg,var(--logo-grad-1),var(--logo-grad-2))">real‑time AI</span></h1><p class="mt-3 text-slate-200/90">Extract, translate, and convert between text and speech in a single, elegant tool. Fast. Accurate. Private.</p><ul class="mt-5 space-y-2 text-sm text-slate-200/90"><li class="flex items-start gap-3"><svg width="18" height="18" viewBox="0 0 24 24" fill="none" stroke="currentColor" stroke-width="2" class="mt-0.5 text-brand-300"><path d="M20 6L9 17l-5-5"/></svg>PDF text extraction with OCR-ready pipeline</li><li class="flex items-start gap-3"><svg width="18" height="18" viewBox="0 0 24 24" fill="none" stroke="currentColor" stroke-width="2" class="mt-0.5 text-brand-300"><path d="M20 6L9 17l-5-5"/></svg>Multi‑language translation</li><li class="flex items-start gap-3"><svg width="18" height="18" viewBox="0 0 24 24" fill="none" stroke="currentColor" stroke-width="2" class="mt-0.5 text-brand-300"><path d="M20 6L9 17l-5-5"/></svg>Natural‑sounding text‑to‑speech</li><li class="flex items-start gap-3"><svg width="18" height="18" viewBox="0 0 24 24" fill="none" stroke="currentColor" stroke-width="2" class="mt-0.5 text-brand-300"><path d="M20 6L9 17l-5-5"/></svg>Accurate speech recognition</li></ul></div><div class="glass rounded-2xl shadow-glass p-6 md:p-8"><form id="toolForm" class="space-y-5" enctype="multipart/form-data"><div><label class="block text-sm font-semibold mb-2" for="mode">Processing Mode</label><div class="relative"><select id="mode" name="mode" class="w-full appearance-none rounded-xl bg-slate-900/60 border border-white/10 px-4 py-3 pr-10 focus:outline-none focus:ring-2 focus:ring-brand-400"><option value="pdf_audio">PDF → Audio • Convert PDF text to speech</option><option value="pdf_translate">PDF → Translate • Extract & translate text</option><option value="pdf_translate_audio">PDF → Translate → Audio • Translate then speech</option><option value="audio_text">Audio → Text • Speech to text</option><option value="audio_translate">Audio → Translate • STT and translate</option><option value="audio_audio">Audio → Audio • Speak back in target language</option></select><div class="pointer-events-none absolute inset-y-0 right-0 flex items-center pr-3"><svg width="18" height="18" viewBox="0 0 24 24" fill="none" stroke="currentColor" stroke-width="2" class="text-slate-300"><path d="M6 9l6 6 6-6"/></svg></div></div></div><div><label class="block text-sm font-semibold mb-2" for="lang">Target Language</label><select id="lang" name="lang" class="w-full rounded-xl bg-slate-900/60 border border-white/10 px-4 py-3 focus:outline-none focus:ring-2 focus:ring-brand-400"></select></div><div id="formatRow"><label class="block text-sm font-semibold mb-2" for="format">Audio Format</label><select id="format" name="format" class="w-full rounded-xl bg-slate-900/60 border border-white/10 px-4 py-3 focus:outline-none focus:ring-2 focus:ring-brand-400"><option value="mp3">MP3 • Standard</option><option value="mp3-low">MP3 • Small (mono, low bitrate)</option><option value="opus">Opus • Smallest, for slow connections</option></select></div><div id="pdfInput"><label class="block text-sm font-semibold mb-2" for="pdf">1. Upload PDF</label><label class="group flex items-center justify-between gap-4 rounded-xl border border-dashed border-white/15 bg-slate-900/50 p-4 hover:border-brand-300 cursor-pointer"><div class="flex items-center gap-3"><div class="rounded-lg p-2" style="background:linear-gradient(90deg,var(--logo-grad-1),var(--logo-grad-2))"><svg width="18" height="18" viewBox="0 0 24 24" fill="none" stroke="white" stroke-width="2"><path d="M21 15v4a2 2 0 0 1-2 2H5a2 2 0 0 1-2-2v-4"/><polyline points="17 8 12 3 7 8"/><line x1="12" y1="3" x2="12" y2="15"/></svg></div><div><div class="text-sm font-semibold">Drag & drop your PDF here</div><div class="text-xs text-slate-300">or click to browse • Max 10MB</div></div></div><input id="pdf" name="pdf" type="file" accept="application/pdf" class="sr-only" /><span id="pdfName" class="text-xs text-slate-300">No file chosen</span></label></div><div id="audioInput" class="hidden"><label class="block text-sm font-semibold mb-2" for="audio">1. Upload Audio</label><label class="group flex items-center justify-between gap-4 rounded-xl border border-dashed border-white/15 bg-slate-900/50 p-4 hover:border-brand-300 cursor-pointer"><div class="flex items-center gap-3"><div class="rounded-lg p-2" style="background:linear-gradient(90deg,var(--logo-grad-1),var(--logo-grad-2))"><svg width="18" height="18" viewBox="0 0 24 24" fill="none" stroke="white" stroke-width="2"><path d="M12 1v11"/><path d="M5 10a7 7 0 0 0 14 0"/><path d="M8 21h8"/></svg></div><div><div class="text-sm font-semibold">Drag & drop your audio</div><div class="text-xs text-slate-300">MP3, WAV, M4A, OGG • Max 10MB</div></div></div><input id="audio" name="audio" type="file" accept="audio/*" class="sr-only" /><span id="audioName" class="text-xs text-slate-300">No file chosen</span></label></div><div id="sttLangRow" class="hidden"><label for="stt_lang" class="block text-sm font-semibold mb-2">Speech Language (for STT)</label><select id="stt_lang" name="stt_lang" class="w-full rounded-xl bg-slate-900/60 border border-white/10 px-4 py-3 focus:outline-none focus:ring-2 focus:ring-brand-400"></select></div><button type="submit" class="btn-primary w-full rounded-xl py-3.5 font-semibold text-white shadow-lg active:scale-[.99] transition">2. Start Processing</button><div id="progressWrap" class="hidden h-2 w-full overflow-hidden rounded bg-white/10"><div class="h-full w-0 bg-white/60 animate-[loader_2s_ease_infinite]"></div></div><style>@keyframes loader{0%{width:0}50%{width:80%}100%{width:100%}}</style><div class="space-y-3 pt-2"><audio id="player" class="hidden w-full" controls></audio><textarea id="outputText" class="hidden w-full min-h-[140px] rounded-xl bg-slate-900/60 border border-white/10 p-3 text-sm" placeholder="Results will appear here"></textarea></div></form></div></div></section>
   <section class="mx-auto max-w-6xl px-4 pb-10"><div class="grid sm:grid-cols-2 lg:grid-cols-4 gap-4"><div class="glass rounded-xl p-4 flex items-start gap-3"><div class="rounded-md p-2" style="background:linear-gradient(90deg,var(--logo-grad-1),var(--logo-grad-2))"><svg width="18" height="18" viewBox="0 0 24 24" fill="none" stroke="white" stroke-width="2"><path d="M14 2H6a2 2 0 0 0-2 2v16a2 2 0 0 0 2 2h12a2 2 0 0 0 2-2V8z"/><path d="M14 2v6h6"/></svg></div><div><div class="font-semibold">PDF Extraction</div><div class="text-xs text-slate-300">Pull clean text from complex PDFs.</div></div></div><div class="glass rounded-xl p-4 flex items-start gap-3"><div class="rounded-md p-2" style="background:linear-gradient(90deg,var(--logo-grad-1),var(--logo-grad-2))"><svg width="18" height="18" viewBox="0 0 24 24" fill="none" stroke="white" stroke-width="2"><path d="M5 12h14"/><path d="M12 5l7 7-7 7"/></svg></div><div><div class="font-semibold">Translate</div><div class="text-xs text-slate-300">20+ languages, auto‑detect.</div></div></div><div class="glass rounded-xl p-4 flex items-start gap-3"><div class="rounded-md p-2" style="background:linear-gradient(90deg,var(--logo-grad-1),var(--logo-grad-2))"><svg width="18" height="18" viewBox="0 0 24 24" fill="none" stroke="white" stroke-width="2"><path d="M12 1v11"/><path d="M5 10a7 7 0 0 0 14 0"/><path d="M8 21h8"/></svg></div><div><div class="font-semibold">Text‑to‑Speech</div><div class="text-xs text-slate-300">Natural voices, quick output.</div></div></div><div class="glass rounded-xl p-4 flex items-start gap-3"><div class="rounded-md p-2" style="background:linear-gradient(90deg,var(--logo-grad-1),var(--logo-grad-2))"><svg width="18" height="18" viewBox="0 0 24 24" fill="none" stroke="white" stroke-width="2"><path d="M12 5v6"/><rect x="9" y="11" width="6" height="8" rx="2"/></svg></div><div><div class="font-semibold">Speech‑to‑Text</div><div class="text-xs text-slate-300">Accurate recognition.</div></div></div></div></section>
   <footer class="mt-auto border-t border-white/10"><div class="mx-auto max-w-6xl px-4 py-6 text-center text-sm text-slate-300">© A&T Group Strategy First AI Hackathon 2025</div></footer>
   <script>
@@ -302,10 +2734,12 @@ INDEX_HTML = """
     const pdfName = document.getElementById('pdfName');
     const audioName = document.getElementById('audioName');
 
-    function updateFormVisibility(){const m=modeSel.value;const pdfNeeded=(m==='pdf_audio'||m==='pdf_translate'||m==='pdf_translate_audio');pdfInput.classList.toggle('hidden',!pdfNeeded);audioInput.classList.toggle('hidden',pdfNeeded);sttLangRow.classList.toggle('hidden',!(m==='audio_text'||m==='audio_translate'||m==='audio_audio'));}
+    function updateFormVisibility(){const m=modeSel.value;const pdfNeeded=(m==='pdf_audio'||m==='pdf_translate'||m==='pdf_translate_audio');pdfInput.classList.toggle('hidden',!pdfNeeded);audioInput.classList.toggle('hidden',pdfNeeded);sttLangRow.classList.toggle('hidden',!(m==='audio_text'||m==='audio_translate'||m==='audio_audio'));formatRow.classList.toggle('hidden',!(m==='pdf_audio'||m==='pdf_translate_audio'||m==='audio_audio'));}
+    let pdfDocument={file:null,id:null};
+    async function documentId(pdf){if(pdfDocument.file===pdf&&pdfDocument.id)return pdfDocument.id;const d=new FormData();d.append('pdf',pdf);const r=await fetch('/documents',{method:'POST',body:d});if(!r.ok)return null;pdfDocument={file:pdf,id:(await r.json()).id};return pdfDocument.id;}
     function updateFileStatus(){const p=pdfFileInput?.files?.[0];const a=audioFileInput?.files?.[0];if(p)pdfName.textContent=p.name;else pdfName.textContent='No file chosen';if(a)audioName.textContent=a.name;else audioName.textContent='No file chosen';}
     modeSel.addEventListener('change',updateFormVisibility);pdfFileInput.addEventListener('change',updateFileStatus);audioFileInput.addEventListener('change',updateFileStatus);updateFormVisibility();
-    document.getElementById('toolForm').addEventListener('submit',async(e)=>{e.preventDefault();progressWrap.classList.remove('hidden');player.classList.add('hidden');outputText.classList.add('hidden');outputText.value='';const m=modeSel.value;const lang=document.getElementById('lang').value;const sttLang=document.getElementById('stt_lang').value;const maxFileSize=10*1024*1024;const fd=new FormData();if(m.startsWith('pdf')){const pdf=pdfFileInput.files[0];if(!pdf){alert('Please choose a PDF.');progressWrap.classList.add('hidden');return;}if(pdf.size>maxFileSize){alert('Document is too large (max 10MB).');progressWrap.classList.add('hidden');return;}fd.append('pdf',pdf);fd.append('lang',lang);}else{const audio=audioFileInput.files[0];if(!audio){alert('Please choose an audio file.');progressWrap.classList.add('hidden');return;}if(audio.size>maxFileSize){alert('Audio is too large (max 10MB).');progressWrap.classList.add('hidden');return;}fd.append('audio',audio);fd.append('lang',lang);fd.append('stt_lang',sttLang);}const endpoints={pdf_audio:'/pdf-to-audio',pdf_translate:'/pdf-to-translate',pdf_translate_audio:'/pdf-to-translate-audio',audio_text:'/audio-to-text',audio_translate:'/audio-to-translate',audio_audio:'/audio-to-audio'};try{const res=await fetch(endpoints[m],{method:'POST',body:fd});if(!res.ok){const msg=await res.text();alert(`Error: ${msg}`);progressWrap.classList.add('hidden');return;}if(m==='pdf_audio'||m==='pdf_translate_audio'||m==='audio_audio'){const blob=await res.blob();const url=URL.createObjectURL(blob);player.src=url;player.classList.remove('hidden');}else{const data=await res.json();const text=data.translated_text||data.text||JSON.stringify(data);outputText.value=text;outputText.classList.remove('hidden');}}catch(e){alert(`Network error: ${e.message}`);}progressWrap.classList.add('hidden');});
+    document.getElementById('toolForm').addEventListener('submit',async(e)=>{e.preventDefault();progressWrap.classList.remove('hidden');player.classList.add('hidden');outputText.classList.add('hidden');outputText.value='';const m=modeSel.value;const lang=document.getElementById('lang').value;const sttLang=document.getElementById('stt_lang').value;const maxFileSize=10*1024*1024;const fd=new FormData();fd.append('format',document.getElementById('format').value);if(m.startsWith('pdf')){const pdf=pdfFileInput.files[0];if(!pdf){alert('Please choose a PDF.');progressWrap.classList.add('hidden');return;}if(pdf.size>maxFileSize){alert('Document is too large (max 10MB).');progressWrap.classList.add('hidden');return;}fd.append('lang',lang);}else{const audio=audioFileInput.files[0];if(!audio){alert('Please choose an audio file.');progressWrap.classList.add('hidden');return;}if(audio.size>maxFileSize){alert('Audio is too large (max 10MB).');progressWrap.classList.add('hidden');return;}fd.append('audio',audio);fd.append('lang',lang);fd.append('stt_lang',sttLang);}const endpoints={pdf_audio:'/pdf-to-audio',pdf_translate:'/pdf-to-translate',pdf_translate_audio:'/pdf-to-translate-audio',audio_text:'/audio-to-text',audio_translate:'/audio-to-translate',audio_audio:'/audio-to-audio'};try{const send=async()=>{if(m.startsWith('pdf')){const pdf=pdfFileInput.files[0];const id=await documentId(pdf);if(id)fd.set('document_id',id);else fd.set('pdf',pdf);}return fetch(endpoints[m],{method:'POST',body:fd});};let res=await send();if(res.status===404&&fd.has('document_id')){pdfDocument.id=null;fd.delete('document_id');res=await send();}if(!res.ok){const msg=await res.text();alert(`Error: ${msg}`);progressWrap.classList.add('hidden');return;}if(m==='pdf_audio'||m==='pdf_translate_audio'||m==='audio_audio'){const loc=res.headers.get('Content-Location');if(loc){res.body?.cancel();player.src=loc;}else{const blob=await res.blob();player.src=URL.createObjectURL(blob);}player.classList.remove('hidden');}else{const data=await res.json();const text=data.translated_text||data.text||JSON.stringify(data);outputText.value=text;outputText.classList.remove('hidden');}}catch(e){alert(`Network error: ${e.message}`);}progressWrap.classList.add('hidden');});
   </script>
 </body>
 </html>
@@ -313,4 +2747,9 @@ INDEX_HTML = """
 
 if __name__ == '__main__':
     port = int(os.getenv('PORT', 5000))
-    app.run(host='0.0.0.0', port=port)
+    if '--async' in sys.argv[1:]:
+        if aio_app is None:
+            sys.exit("Async mode needs aiohttp: pip install aiohttp")
+        web.run_app(aio_app, host='0.0.0.0', port=port)
+    else:
+        app.run(host='0.0.0.0', port=port)
@@ -0,0 +1,331 @@
+"""Load benchmark for the conversion routes, run against local upstream stand-ins.
+
+    python bench.py                                   # every route at concurrency 1, 4 and 16
+    python bench.py --routes pdf-to-audio audio-to-text --concurrency 8 --requests 40 --latency 0.2
+    python bench.py --app-env TTS_CONCURRENCY=8       # compare a tuning knob against a baseline
+    python bench.py --async --concurrency 64          # the aiohttp server (I/O-bound routes only)
+
+Starts stub_server.py in place of LibreTranslate, gTTS and Google Speech, then starts a fresh
+app.py pointed at it for every route and concurrency level, so caches start cold and the peak
+RSS belongs to that run alone. Every request carries unique content, so none of the app's
+caches (results, translation memory, TTS segments) can hit; pass --warm to send the same
+document every time.
+
+Reports requests/sec, p50/p95/p99 latency and the app's peak RSS, and appends the table to
+bench_output.txt. Needs ffmpeg on PATH for the audio routes, like the app itself.
+"""
+import argparse
+import array
+import io
+import math
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import textwrap
+import threading
+import time
+import uuid
+import wave
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+OUTPUT_FILE = os.path.join(HERE, 'bench_output.txt')
+
+ASYNC_ROUTES = ['pdf-to-translate', 'audio-to-translate', 'audio-to-audio']
+
+# route -> (upload field, form fields)
+ROUTES = {
+    'pdf-to-audio': ('pdf', {'lang': 'en'}),
+    'pdf-to-translate': ('pdf', {'lang': 'fr'}),
+    'pdf-to-translate-audio': ('pdf', {'lang': 'fr'}),
+    'audio-to-text': ('audio', {'stt_lang': 'en'}),
+    'audio-to-translate': ('audio', {'stt_lang': 'en', 'lang': 'fr'}),
+    'audio-to-audio': ('audio', {'stt_lang': 'en', 'lang': 'fr'}),
+    'audio-to-audio/stream': ('audio', {'stt_lang': 'en', 'lang': 'fr'}),
+}
+
+WORDS = ("the quick brown fox jumps over a lazy dog while seven wizards quietly judge "
+         "boxing matches in distant valleys where rivers carry old stories toward the sea").split()
+
+# ---------- Corpus ----------
+def _pdf_escape(text: str) -> str:
+    return text.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+
+def make_pdf(pages: list) -> bytes:
+    """A minimal PDF with one block of Helvetica text per page."""
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>", None,
+               "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for text in pages:
+        lines = " ".join(f"({_pdf_escape(line)}) '" for line in textwrap.wrap(text, 90))
+        stream = f"BT /F1 10 Tf 14 TL 40 800 Td {lines} ET"
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream")
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+                       f"/Resources << /Font << /F1 3 0 R >> >> /Contents {len(objects)} 0 R >>")
+        kids.append(f"{len(objects)} 0 R")
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {len(kids)} >>"
+
+    out = io.BytesIO()
+    out.write(b"%PDF-1.4\n")
+    offsets = []
+    for number, obj in enumerate(objects, 1):
+        offsets.append(out.tell())
+        out.write(f"{number} 0 obj\n{obj}\nendobj\n".encode('latin-1'))
+    xref = out.tell()
+    out.write(f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode())
+    for offset in offsets:
+        out.write(f"{offset:010d} 00000 n \n".encode())
+    out.write(f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode())
+    return out.getvalue()
+
+def make_document(nonce: str, pages: int, chars_per_page: int) -> bytes:
+    """Pages of pseudo-prose; every sentence carries the nonce so no two documents share one."""
+    rng = random.Random(nonce)
+    texts = []
+    for page in range(pages):
+        sentences, length = [], 0
+        while length < chars_per_page:
+            words = rng.choices(WORDS, k=rng.randint(8, 16))
+            sentence = f"{' '.join(words).capitalize()} {nonce}-{page}-{len(sentences)}."
+            sentences.append(sentence)
+            length += len(sentence) + 1
+        texts.append(" ".join(sentences))
+    return make_pdf(texts)
+
+class AudioCorpus:
+    """Bursts of noise separated by short silences, so the app can segment it at pauses."""
+    RATE = 16000
+    BURST_SECONDS = 4.0
+    PAUSE_SECONDS = 0.7
+
+    def __init__(self, seconds: float):
+        rng = random.Random(0)
+        noise = array.array('h', (int(rng.gauss(0, 6000)) for _ in range(self.RATE)))
+        burst, pause = int(self.BURST_SECONDS * self.RATE), int(self.PAUSE_SECONDS * self.RATE)
+        self.samples = array.array('h')
+        self.burst_starts = []
+        while len(self.samples) < seconds * self.RATE:
+            self.burst_starts.append(len(self.samples))
+            self.samples.extend((noise * math.ceil(burst / len(noise)))[:burst])
+            self.samples.extend(array.array('h', bytes(pause * 2)))
+
+    def make(self, nonce: str) -> bytes:
+        """A WAV whose every burst starts with samples derived from the nonce."""
+        samples = array.array('h', self.samples)
+        stamp = array.array('h', uuid.uuid5(uuid.NAMESPACE_OID, nonce).bytes)
+        for start in self.burst_starts:
+            samples[start:start + len(stamp)] = stamp
+        out = io.BytesIO()
+        with wave.open(out, 'wb') as wav:
+            wav.setnchannels(1)
+            wav.setsampwidth(2)
+            wav.setframerate(self.RATE)
+            wav.writeframes(samples.tobytes())
+        return out.getvalue()
+
+# ---------- Processes ----------
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+def start_server(script: str, port: int, env: dict, log, ready_path: str, argv=()) -> subprocess.Popen:
+    proc = subprocess.Popen([sys.executable, os.path.join(HERE, script), *argv],
+                            env={**os.environ, **env, 'PORT': str(port)},
+                            stdout=log, stderr=subprocess.STDOUT)
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise SystemExit(f"{script} exited with status {proc.returncode}; see {log.name}")
+        try:
+            requests.get(f"http://127.0.0.1:{port}{ready_path}", timeout=1)
+            return proc
+        except requests.exceptions.ConnectionError:
+            time.sleep(0.2)
+    proc.kill()
+    raise SystemExit(f"{script} did not start within 60 s; see {log.name}")
+
+def stop_server(proc: subprocess.Popen):
+    proc.terminate()
+    try:
+        proc.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+        proc.wait()
+
+def peak_rss_mb(pid: int):
+    """The process's high-water resident set size, or None where /proc isn't available."""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+# ---------- Load ----------
+def percentile(sorted_values: list, p: float) -> float:
+    if not sorted_values:
+        return float('nan')
+    return sorted_values[max(0, math.ceil(p / 100 * len(sorted_values)) - 1)]
+
+def drive(base_url: str, route: str, bodies: list, concurrency: int, timeout: float) -> dict:
+    field, form = ROUTES[route]
+    filename, mimetype = ('doc.pdf', 'application/pdf') if field == 'pdf' else ('speech.wav', 'audio/wav')
+    local = threading.local()
+
+    def one(body: bytes):
+        session = getattr(local, 'session', None) or requests.Session()
+        local.session = session
+        started = time.perf_counter()
+        try:
+            r = session.post(f"{base_url}/{route}", files={field: (filename, body, mimetype)},
+                             data=form, timeout=timeout)
+            ok = r.status_code == 200
+        except requests.exceptions.RequestException:
+            ok = False
+        return time.perf_counter() - started, ok
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(one, bodies))
+    elapsed = time.perf_counter() - started
+    latencies = sorted(latency for latency, ok in results if ok)
+    return {
+        'ok': len(latencies),
+        'errors': len(results) - len(latencies),
+        'rps': len(latencies) / elapsed if elapsed else 0.0,
+        'p50': percentile(latencies, 50),
+        'p95': percentile(latencies, 95),
+        'p99': percentile(latencies, 99),
+    }
+
+def run(args) -> list:
+    workdir = tempfile.mkdtemp(prefix='pdf-ai-bench-')
+    stub_log = open(os.path.join(workdir, 'stub.log'), 'w')
+    stub_port = free_port()
+    stub_url = f"http://127.0.0.1:{stub_port}"
+    stub = start_server('stub_server.py', stub_port, {
+        'STUB_LATENCY': str(args.latency),
+        **({'STUB_TRANSLATE_LATENCY': str(args.translate_latency)} if args.translate_latency is not None else {}),
+        **({'STUB_TTS_LATENCY': str(args.tts_latency)} if args.tts_latency is not None else {}),
+        **({'STUB_STT_LATENCY': str(args.stt_latency)} if args.stt_latency is not None else {}),
+    }, stub_log, '/languages')
+
+    audio = AudioCorpus(args.audio_seconds) if any(ROUTES[r][0] == 'audio' for r in args.routes) else None
+    run_id = uuid.uuid4().hex[:8]
+    rows = []
+    try:
+        for route in args.routes:
+            field = ROUTES[route][0]
+            for concurrency in args.concurrency:
+                count = args.requests or max(10, 4 * concurrency)
+                nonces = [f"{run_id}{route}{concurrency}{i}" for i in range(count + args.warmup)]
+                if args.warm:
+                    nonces = [f"{run_id}{route}"] * len(nonces)
+                if field == 'pdf':
+                    bodies = [make_document(n, args.pages, args.chars_per_page) for n in nonces]
+                else:
+                    bodies = [audio.make(n) for n in nonces]
+
+                state = os.path.join(workdir, f"{route}-{concurrency}")
+                os.makedirs(state)
+                app_port = free_port()
+                app_env = {
+                    'TRANSLATE_BACKEND': 'libretranslate',
+                    'LIBRETRANSLATE_URL': stub_url + '/',
+                    'TTS_ENDPOINT': stub_url + '/_/TranslateWebserverUi/data/batchexecute',
+                    'STT_ENDPOINT': stub_url + '/speech-api/v2/recognize',
+                    'LANGUAGES_CACHE_FILE': os.path.join(state, 'languages.json'),
+                    'RESULT_CACHE_DIR': os.path.join(state, 'results'),
+                    'JOBS_DIR': os.path.join(state, 'jobs'),
+                    'DOCUMENTS_DIR': os.path.join(state, 'documents'),
+                    'TRANSLATION_MEMORY_PATH': os.path.join(state, 'tm.sqlite3'),
+                    'TTS_CACHE_PATH': os.path.join(state, 'tts.sqlite3'),
+                    **dict(item.split('=', 1) for item in args.app_env),
+                }
+                with open(os.path.join(state, 'app.log'), 'w') as app_log:
+                    app = start_server('app.py', app_port, app_env, app_log, '/metrics',
+                                       ['--async'] if args.async_mode else [])
+                    try:
+                        base_url = f"http://127.0.0.1:{app_port}"
+                        drive(base_url, route, bodies[:args.warmup], 1, args.timeout)
+                        result = drive(base_url, route, bodies[args.warmup:], concurrency, args.timeout)
+                        result['rss'] = peak_rss_mb(app.pid)
+                    finally:
+                        stop_server(app)
+                result.update(route=route, concurrency=concurrency)
+                rows.append(result)
+                print(format_row(result), flush=True)
+    finally:
+        stop_server(stub)
+        stub_log.close()
+        if args.keep:
+            print(f"Logs and app state kept in {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+    return rows
+
+# ---------- Report ----------
+HEADER = f"{'route':<24} {'conc':>4} {'ok':>5} {'err':>4} {'req/s':>8} {'p50 s':>8} {'p95 s':>8} {'p99 s':>8} {'peak RSS MB':>12}"
+
+def format_row(row: dict) -> str:
+    rss = f"{row['rss']:.1f}" if row['rss'] is not None else 'n/a'
+    return (f"{row['route']:<24} {row['concurrency']:>4} {row['ok']:>5} {row['errors']:>4} {row['rps']:>8.2f} "
+            f"{row['p50']:>8.3f} {row['p95']:>8.3f} {row['p99']:>8.3f} {rss:>12}")
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=HERE, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--routes', nargs='+', choices=list(ROUTES), default=list(ROUTES))
+    parser.add_argument('--concurrency', nargs='+', type=int, default=[1, 4, 16])
+    parser.add_argument('--requests', type=int, help='requests per route and level (default: 4 x concurrency, at least 10)')
+    parser.add_argument('--warmup', type=int, default=1, help='untimed requests sent before each level')
+    parser.add_argument('--latency', type=float, default=0.1, help='seconds added to every upstream call')
+    parser.add_argument('--translate-latency', type=float, help='overrides --latency for LibreTranslate')
+    parser.add_argument('--tts-latency', type=float, help='overrides --latency for gTTS')
+    parser.add_argument('--stt-latency', type=float, help='overrides --latency for Google Speech')
+    parser.add_argument('--pages', type=int, default=3, help='pages per PDF')
+    parser.add_argument('--chars-per-page', type=int, default=1500)
+    parser.add_argument('--audio-seconds', type=float, default=60, help='length of each audio upload')
+    parser.add_argument('--warm', action='store_true', help='send the same document every time')
+    parser.add_argument('--timeout', type=float, default=300, help='client timeout per request')
+    parser.add_argument('--app-env', nargs='*', default=[], metavar='KEY=VALUE', help='extra environment for app.py')
+    parser.add_argument('--keep', action='store_true', help='keep logs and app state after the run')
+    parser.add_argument('--async', dest='async_mode', action='store_true',
+                        help=f"run app.py --async; only {', '.join(ASYNC_ROUTES)} are served")
+    args = parser.parse_args(argv)
+    if args.async_mode:
+        args.routes = [route for route in args.routes if route in ASYNC_ROUTES]
+        if not args.routes:
+            parser.error(f"--async serves only {', '.join(ASYNC_ROUTES)}")
+
+    settings = (f"latency={args.latency}s pages={args.pages}x{args.chars_per_page} audio={args.audio_seconds}s "
+                f"async={args.async_mode} warm={args.warm} app_env={' '.join(args.app_env) or '-'}")
+    print(f"pdf-ai benchmark @ {git_revision()}  {settings}")
+    print(HEADER, flush=True)
+    rows = run(args)
+
+    with open(OUTPUT_FILE, 'a') as f:
+        f.write(f"# {time.strftime('%Y-%m-%d %H:%M:%S')} @ {git_revision()}  {settings}\n")
+        f.write(HEADER + "\n")
+        for row in rows:
+            f.write(format_row(row) + "\n")
+        f.write("\n")
+    print(f"Appended to {OUTPUT_FILE}")
+
+if __name__ == '__main__':
+    main()
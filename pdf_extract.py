@@ -0,0 +1,74 @@
+"""PDF text extraction, kept apart from app.py so the extract pool's spawned worker
+processes can import it without starting the app's background threads, translation
+clients and servers. Nothing here may have import-time side effects.
+"""
+import os
+from PyPDF2 import PdfReader
+from PyPDF2.errors import PdfReadError
+
+MAX_FILE_SIZE = 10 * 1024 * 1024  # 10MB
+MAX_TEXT_LENGTH = int(os.getenv('MAX_TEXT_LENGTH', 100000))  # Safety cap on extracted text
+
+def check_file_size(file):
+    file.seek(0, os.SEEK_END)
+    size = file.tell()
+    file.seek(0)
+    if size > MAX_FILE_SIZE:
+        raise ValueError(f"File size exceeds {MAX_FILE_SIZE / 1024 / 1024}MB limit")
+    return file
+
+def limit_text(text: str) -> str:
+    if len(text) > MAX_TEXT_LENGTH:
+        return text[:MAX_TEXT_LENGTH] + "... [truncated]"
+    return text
+
+def open_pdf(file_storage) -> PdfReader:
+    try:
+        check_file_size(file_storage)
+        reader = PdfReader(file_storage)
+    except PdfReadError:
+        raise ValueError("Invalid or corrupted PDF file. Please try another file.")
+
+    if reader.is_encrypted:
+        try:
+            reader.decrypt("")
+        except Exception:
+            raise ValueError("This PDF is password protected and cannot be processed.")
+    return reader
+
+def iter_pdf_text(reader: PdfReader):
+    # Pages are extracted lazily so callers can start working on the first page early.
+    for page in reader.pages:
+        extracted = page.extract_text()
+        if extracted and extracted.strip():
+            yield extracted
+
+def extract_pages_from_pdf(file_storage) -> tuple:
+    """Return the document's text and the offset in it where each page starts."""
+    reader = open_pdf(file_storage)
+    pages, starts, offset = [], [], 0
+    for page in reader.pages:
+        starts.append(offset)
+        extracted = page.extract_text()
+        if extracted and extracted.strip():
+            pages.append(extracted)
+            offset += len(extracted) + 1
+    text = "\n".join(pages)
+    lead = len(text) - len(text.lstrip())
+    text = text.strip()
+    if not text:
+        raise ValueError("No readable text found in the PDF.")
+    text = limit_text(text)
+    return text, [min(max(0, start - lead), len(text)) for start in starts]
+
+def extract_text_from_pdf(file_storage) -> str:
+    return extract_pages_from_pdf(file_storage)[0]
+
+# Entry points for the extract pool, which hands its workers a scratch file path.
+def extract_pdf_path(path: str) -> str:
+    with open(path, 'rb') as f:
+        return extract_text_from_pdf(f)
+
+def extract_pdf_pages_path(path: str) -> tuple:
+    with open(path, 'rb') as f:
+        return extract_pages_from_pdf(f)
@@ -0,0 +1,89 @@
+"""Local stand-ins for LibreTranslate, gTTS and Google Speech, for tests, benchmarks and local development.
+
+Run it and point the app at it:
+
+    python stub_server.py                       # listens on port 5001
+    LIBRETRANSLATE_URL=http://127.0.0.1:5001/ \
+    TTS_ENDPOINT=http://127.0.0.1:5001/_/TranslateWebserverUi/data/batchexecute \
+    STT_ENDPOINT=http://127.0.0.1:5001/speech-api/v2/recognize python app.py
+
+Translations are the input prefixed with the target language, e.g. "[fr] Hello". Speech is
+a run of silent MP3 frames, and transcripts name a hash of the audio they were given.
+
+STUB_LATENCY adds a fixed delay in seconds to every upstream call; STUB_TRANSLATE_LATENCY,
+STUB_TTS_LATENCY and STUB_STT_LATENCY override it per service.
+"""
+import base64
+import hashlib
+import json
+import os
+import time
+from flask import Flask, Response, request, jsonify
+
+LANGUAGES = [
+    {"code": "en", "name": "English", "targets": ["de", "es", "fr"]},
+    {"code": "fr", "name": "French", "targets": ["de", "en", "es"]},
+    {"code": "es", "name": "Spanish", "targets": ["de", "en", "fr"]},
+    {"code": "de", "name": "German", "targets": ["en", "es", "fr"]},
+]
+
+LATENCY = float(os.getenv('STUB_LATENCY', 0))
+TRANSLATE_LATENCY = float(os.getenv('STUB_TRANSLATE_LATENCY', LATENCY))
+TTS_LATENCY = float(os.getenv('STUB_TTS_LATENCY', LATENCY))
+STT_LATENCY = float(os.getenv('STUB_STT_LATENCY', LATENCY))
+
+# One silent MPEG-1 Layer III frame (128 kbps, 44.1 kHz, 26 ms)
+SILENT_FRAME = b"\xff\xfb\x90\x64" + bytes(413)
+CHARS_PER_FRAME = 2  # Roughly the speaking rate of gTTS
+
+stub = Flask(__name__)
+
+def _params() -> dict:
+    return request.get_json(silent=True) or request.form.to_dict()
+
+@stub.route('/languages', methods=['GET'])
+def languages():
+    return jsonify(LANGUAGES)
+
+@stub.route('/translate', methods=['POST'])
+def translate():
+    time.sleep(TRANSLATE_LATENCY)
+    params = _params()
+    q, target = params.get('q'), params.get('target')
+    if q is None or not target:
+        return jsonify({"error": "Invalid request: missing q or target parameter"}), 400
+    if isinstance(q, list):
+        return jsonify({"translatedText": [f"[{target}] {text}" for text in q]})
+    return jsonify({"translatedText": f"[{target}] {q}"})
+
+@stub.route('/detect', methods=['POST'])
+def detect():
+    return jsonify([{"confidence": 90.0, "language": "en"}])
+
+@stub.route('/_/TranslateWebserverUi/data/batchexecute', methods=['POST'])
+def batchexecute():
+    """gTTS's RPC endpoint; f.req wraps a JSON array whose first element is the text."""
+    time.sleep(TTS_LATENCY)
+    try:
+        rpc = json.loads(request.form['f.req'])
+        text = json.loads(rpc[0][0][1])[0]
+    except (KeyError, IndexError, TypeError, ValueError):
+        return "Bad f.req", 400
+    audio = SILENT_FRAME * max(1, len(text) // CHARS_PER_FRAME)
+    payload = json.dumps([["wrb.fr", "jQ1olc", json.dumps([base64.b64encode(audio).decode()]), None]], separators=(',', ':'))
+    return Response(")]}'\n\n" + payload, mimetype='application/json')
+
+@stub.route('/speech-api/v2/recognize', methods=['POST'])
+def recognize():
+    time.sleep(STT_LATENCY)
+    audio = request.get_data()
+    if not audio:
+        return Response('{"result":[]}\n', mimetype='application/json')
+    transcript = f"segment {hashlib.sha1(audio).hexdigest()[:12]} of {len(audio)} bytes in {request.args.get('lang', 'en-US')}"
+    result = {"result": [{"alternative": [{"transcript": transcript, "confidence": 0.9}], "final": True}],
+              "result_index": 0}
+    return Response('{"result":[]}\n' + json.dumps(result) + "\n", mimetype='application/json')
+
+if __name__ == '__main__':
+    port = int(os.getenv('PORT', 5001))
+    stub.run(host='127.0.0.1', port=port, threaded=True)
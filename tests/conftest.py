@@ -0,0 +1,36 @@
+"""Point the app at stub_server.py, running in this process, before anything imports it.
+
+Every cache, scratch and state directory goes to a fresh temp directory, so runs don't
+see each other's results or translation memory.
+"""
+import os
+import shutil
+import tempfile
+import threading
+
+from werkzeug.serving import make_server
+
+import stub_server
+
+_stub = make_server('127.0.0.1', 0, stub_server.stub, threaded=True)
+threading.Thread(target=_stub.serve_forever, name='stub-server', daemon=True).start()
+STUB_URL = f"http://127.0.0.1:{_stub.server_port}/"
+
+STATE_DIR = tempfile.mkdtemp(prefix='pdf-ai-tests-')
+os.environ.update({
+    'LIBRETRANSLATE_URL': STUB_URL,
+    'TTS_ENDPOINT': STUB_URL + '_/TranslateWebserverUi/data/batchexecute',
+    'STT_ENDPOINT': STUB_URL + 'speech-api/v2/recognize',
+    'LANGUAGES_CACHE_FILE': os.path.join(STATE_DIR, 'languages.json'),
+    'TRANSLATION_MEMORY_PATH': os.path.join(STATE_DIR, 'tm.sqlite3'),
+    'TTS_CACHE_PATH': os.path.join(STATE_DIR, 'tts.sqlite3'),
+    'RESULT_CACHE_DIR': os.path.join(STATE_DIR, 'results'),
+    'JOBS_DIR': os.path.join(STATE_DIR, 'jobs'),
+    'DOCUMENTS_DIR': os.path.join(STATE_DIR, 'documents'),
+    'SCRATCH_DISK_DIR': os.path.join(STATE_DIR, 'scratch'),
+    'SCRATCH_RAM_DIR': os.path.join(STATE_DIR, 'no-tmpfs'),
+})
+
+def pytest_sessionfinish(session, exitstatus):
+    _stub.shutdown()
+    shutil.rmtree(STATE_DIR, ignore_errors=True)
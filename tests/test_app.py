@@ -0,0 +1,288 @@
+import asyncio
+import io
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+import requests
+
+import app
+import bench
+
+@pytest.fixture(scope='module', autouse=True)
+def stub_languages():
+    assert app.refresh_languages()
+
+@pytest.fixture
+def client():
+    return app.app.test_client()
+
+def pdf_upload(text: str, name: str = 'doc.pdf'):
+    return io.BytesIO(bench.make_pdf([text])), name
+
+# ---------- Translation backend ----------
+def test_libretranslate_list_round_trip():
+    assert app.translator.translate(['Hello.', 'Goodbye.'], 'en', 'fr') == ['[fr] Hello.', '[fr] Goodbye.']
+    assert {'en', 'fr', 'es', 'de'} <= set(app.VALID_STT_LANGS)
+
+def test_pdf_to_translate(client):
+    r = client.post('/pdf-to-translate', data={'pdf': pdf_upload("A route test sentence. Another one."), 'lang': 'fr'})
+    assert r.status_code == 200
+    assert r.get_json() == {'translated_text': "[fr] A route test sentence. [fr] Another one."}
+
+# ---------- Adaptive concurrency ----------
+def _fail(error):
+    raise error
+
+def _run(limiter, executor, fn, *args):
+    try:
+        return limiter.submit(executor, fn, *args).result()
+    except Exception:
+        return None
+
+def test_limiter_ignores_rejected_requests():
+    limiter = app.AdaptiveLimiter('test-rejected', 8)
+    with ThreadPoolExecutor(2) as executor:
+        for _ in range(4):
+            _run(limiter, executor, _fail, app.UpstreamError("target language not supported", 400))
+            _run(limiter, executor, app.validate_tts_lang, 'not-a-language')
+    assert limiter.limit == 8
+    assert limiter.in_flight == 0 and limiter.queued == 0
+
+def test_limiter_halves_on_congestion():
+    limiter = app.AdaptiveLimiter('test-congested', 8)
+    with ThreadPoolExecutor(2) as executor:
+        _run(limiter, executor, _fail, requests.Timeout())
+        assert limiter.limit == 4
+        _run(limiter, executor, _fail, app.UpstreamError("unavailable", 503))
+        assert limiter.limit == 2
+        for _ in range(10):
+            _run(limiter, executor, time.sleep, 0)
+        assert limiter.limit > 2
+
+def test_limiter_sheds_when_backlogged(monkeypatch):
+    monkeypatch.setattr(app, 'UPSTREAM_MAX_BACKLOG', 1)
+    limiter = app.AdaptiveLimiter('test-backlog', 2)
+    limiter.latency, limiter.queued = 1.0, 10
+    with pytest.raises(app.Overloaded) as e:
+        limiter.admit()
+    assert e.value.retry_after >= 1
+
+def test_async_limit_sheds_when_backlogged(monkeypatch):
+    monkeypatch.setattr(app, 'UPSTREAM_MAX_BACKLOG', 1)
+
+    async def backlog():
+        limit = app.AioUpstreamLimit('test-aio', 2)
+        async with limit.slot():
+            await asyncio.sleep(0.01)
+        limit.admit()
+        limit.pending = 500
+        with pytest.raises(app.Overloaded):
+            app.admit_stages(['extract', 'test-aio'], {'test-aio': limit})
+
+    asyncio.run(backlog())
+
+def test_is_congestion_follows_the_exception_chain():
+    def chained(outer, inner):
+        try:
+            try:
+                raise inner
+            except Exception:
+                raise outer
+        except Exception as e:
+            return e
+
+    assert app.is_congestion(requests.ConnectionError())
+    assert app.is_congestion(chained(ValueError("Speech service error"), TimeoutError()))
+    assert not app.is_congestion(ValueError("Language not supported: xx"))
+    assert not app.is_congestion(app.UpstreamError("bad request", 400))
+    assert app.is_congestion(app.UpstreamError("slow down", 429))
+
+def test_libretranslate_error_keeps_status():
+    with pytest.raises(app.UpstreamError) as e:
+        app.translator.translate(['Hello.'], 'en', '')
+    assert e.value.status == 400
+
+def test_bad_language_is_rejected_without_touching_the_limit(client):
+    limit = app.translate_limiter.limit
+    for _ in range(4):
+        r = client.post('/pdf-to-translate', data={'pdf': pdf_upload("Bad language."), 'lang': 'xx'})
+        assert r.status_code == 400
+    assert app.translate_limiter.limit == limit
+
+# ---------- Translation memory ----------
+def test_tm_plan_keeps_wrapped_sentences_whole():
+    parts, keys, known, missing = app.tm_plan("This sentence wraps across\na PDF line break. Next one.", 'en', 'de')
+    assert parts[0::2] == ['This sentence wraps across a PDF line break.', 'Next one.']
+
+def test_tm_plan_splits_paragraphs_at_blank_lines():
+    parts = app.tm_plan("Heading\n\nBody text\ncontinues", 'en', 'de')[0]
+    assert parts == ['Heading', '\n\n', 'Body text continues']
+
+def test_tm_finish_reassembles_and_remembers():
+    text = "Remember me. And me too!\n\nNew paragraph."
+    plan = app.tm_plan(text, 'en', 'es')
+    missing = list(plan[3].values())
+    assert missing == ['Remember me.', 'And me too!', 'New paragraph.']
+    result = app.tm_finish(plan, [s.upper() for s in missing], 'en', 'es')
+    assert result == "REMEMBER ME. AND ME TOO!\n\nNEW PARAGRAPH."
+
+    again = app.tm_plan("And me too! Remember me.", 'en', 'es')
+    assert again[3] == {}
+    assert app.tm_finish(again, [], 'en', 'es') == "AND ME TOO! REMEMBER ME."
+
+def test_translations_are_keyed_by_backend(monkeypatch):
+    tm = app.tm_key('Hello.', 'en', 'fr')
+    result = app.result_cache_key('h', 'pdf_translate', {'lang': 'fr'})
+    audio = app.result_cache_key('h', 'pdf_audio', {'lang': 'fr'})
+    monkeypatch.setattr(app.translator, 'name', 'google-v2')
+    assert app.tm_key('Hello.', 'en', 'fr') != tm
+    assert app.result_cache_key('h', 'pdf_translate', {'lang': 'fr'}) != result
+    assert app.result_cache_key('h', 'pdf_audio', {'lang': 'fr'}) == audio
+
+# ---------- Streaming audio-to-audio ----------
+def _stream_threads() -> list:
+    return [t for t in threading.enumerate() if t.name.startswith('stream-')]
+
+def test_stream_audio_to_audio_stops_when_cancelled_before_reading(monkeypatch):
+    monkeypatch.setattr(app, 'STT_SEGMENT_MIN_SECONDS', 1)
+    monkeypatch.setattr(app, 'STT_SEGMENT_MAX_SECONDS', 2)
+    pcm = bench.AudioCorpus(20).samples.tobytes()
+    frames, cancel = app.stream_audio_to_audio(pcm, {'stt_lang': 'en', 'lang': 'fr'})
+    chunks = app.cache_stream('0' * 64, frames)
+    chunks.close()  # never pulled, like a response closed before its body starts
+    cancel()
+    deadline = time.monotonic() + 5
+    while _stream_threads() and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert _stream_threads() == []
+
+def test_stream_audio_to_audio_yields_every_segment(monkeypatch):
+    monkeypatch.setattr(app, 'STT_SEGMENT_MIN_SECONDS', 1)
+    monkeypatch.setattr(app, 'STT_SEGMENT_MAX_SECONDS', 2)
+    pcm = bench.AudioCorpus(6).samples.tobytes()
+    frames, cancel = app.stream_audio_to_audio(pcm, {'stt_lang': 'en', 'lang': 'fr'})
+    audio = b"".join(frames)
+    assert audio.startswith(b"\xff\xfb")
+
+# ---------- Output formats ----------
+def test_pdf_to_translate_ignores_format(client):
+    text = "Formats only matter for audio."
+    first = client.post('/pdf-to-translate', data={'pdf': pdf_upload(text), 'lang': 'de', 'format': 'opus'})
+    second = client.post('/pdf-to-translate', data={'pdf': pdf_upload(text), 'lang': 'de', 'format': 'bogus'})
+    assert first.status_code == second.status_code == 200
+    assert first.get_json() == second.get_json()
+    assert (app.result_cache_key('h', 'pdf_translate', {'format': 'opus'})
+            == app.result_cache_key('h', 'pdf_translate', {}))
+
+# ---------- Upstream chunking ----------
+def test_pack_chunks_keeps_order_and_limit():
+    pieces = ['a' * 4, 'b' * 4, 'c' * 4, 'd' * 12]
+    assert app.pack_chunks(pieces, 10) == [[0, 1], [2], [3]]
+    assert app.pack_chunks([], 10) == []
+
+def test_split_for_upstream_round_trips_long_sentences(monkeypatch):
+    monkeypatch.setattr(app, 'TRANSLATE_CHUNK_CHARS', 20)
+    sentences = ['Short one.', 'This sentence is much longer than one chunk allows.', 'End.']
+    pieces, owners, chunks = app.split_for_upstream(sentences)
+    assert all(len(piece) <= 20 for piece in pieces)
+    assert sorted(i for chunk in chunks for i in chunk) == list(range(len(pieces)))
+    assert all(sum(len(pieces[i]) + 1 for i in chunk) <= 20 + 1 for chunk in chunks)
+    assert app.join_from_upstream(len(sentences), owners, pieces) == sentences
+
+# ---------- MP3 joining ----------
+def test_strip_id3_removes_both_tag_versions():
+    frames = b"\xff\xfb\x90\x64" + bytes(413)
+    id3v2 = b"ID3\x04\x00\x00" + bytes([0, 0, 1, 0]) + bytes(128)  # 128-byte tag, syncsafe size
+    id3v1 = b"TAG" + bytes(125)
+    assert app.strip_id3(id3v2 + frames + id3v1) == frames
+    assert app.strip_id3(frames) == frames
+
+def test_strip_id3_skips_footer():
+    frames = b"\xff\xfb\x90\x64" + bytes(413)
+    tag = b"ID3\x04\x00\x10" + bytes([0, 0, 0, 5]) + bytes(5) + b"3DI" + bytes(7)
+    assert app.strip_id3(tag + frames) == frames
+
+# ---------- Speech segmentation ----------
+def test_split_on_silence_cuts_in_pauses(monkeypatch):
+    monkeypatch.setattr(app, 'STT_SEGMENT_MIN_SECONDS', 5)
+    monkeypatch.setattr(app, 'STT_SEGMENT_MAX_SECONDS', 10)
+    corpus = bench.AudioCorpus(60)
+    pcm = corpus.samples.tobytes()
+    segments = app.split_on_silence(pcm)
+    assert len(segments) > 5
+    assert b"".join(segments) == pcm
+    assert all(len(segment) <= 10 * app.STT_SAMPLE_RATE * 2 for segment in segments)
+    burst = int(corpus.BURST_SECONDS * corpus.RATE)
+    cut = 0
+    for segment in segments[:-1]:
+        cut += len(segment) // 2
+        start = max(s for s in corpus.burst_starts if s <= cut)
+        assert cut >= start + burst, f"cut at sample {cut} falls inside a burst"
+
+def test_split_on_silence_leaves_short_audio_whole():
+    pcm = bytes(app.STT_SAMPLE_RATE * 2 * 3)
+    assert app.split_on_silence(pcm) == [pcm]
+
+# ---------- Results ----------
+def test_pdf_to_audio(client):
+    r = client.post('/pdf-to-audio', data={'pdf': pdf_upload("Speak this sentence aloud."), 'lang': 'en'})
+    assert r.status_code == 200
+    assert r.mimetype == 'audio/mpeg'
+    assert r.data.startswith(b"\xff\xfb")
+    location = r.headers['Content-Location']
+    cached = client.get(location, headers={'Range': 'bytes=0-3'})
+    assert cached.status_code == 206
+    assert cached.data == r.data[:4]
+
+def test_identical_requests_share_one_upstream_call(client, monkeypatch):
+    calls = []
+    translate = app.translator.translate
+
+    def slow_translate(texts, source, target):
+        calls.append(texts)
+        time.sleep(0.3)  # long enough for every request to arrive while the first is in flight
+        return translate(texts, source, target)
+
+    monkeypatch.setattr(app.translator, 'translate', slow_translate)
+    text = f"Only translate me once {uuid.uuid4().hex}."
+    post = lambda _: client.post('/pdf-to-translate', data={'pdf': pdf_upload(text), 'lang': 'es'})
+    with ThreadPoolExecutor(6) as executor:
+        responses = list(executor.map(post, range(6)))
+    assert len(calls) == 1
+    assert {r.status_code for r in responses} == {200}
+    assert len({r.data for r in responses}) == 1
+    assert not [name for name in os.listdir(app.RESULT_CACHE_DIR) if name.endswith('.lock')]
+
+def test_leader_failure_reaches_every_waiter():
+    key = uuid.uuid4().hex
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        raise ValueError("upstream broke")
+
+    def request(_):
+        try:
+            return app.cached_result(key, 'pdf_translate', compute)
+        except ValueError as e:
+            return e
+
+    with ThreadPoolExecutor(4) as executor:
+        results = [executor.submit(request, None)]
+        assert started.wait(5)
+        results += [executor.submit(request, None) for _ in range(3)]
+        time.sleep(0.2)
+        release.set()
+        errors = [future.result() for future in results]
+    assert len(calls) == 1
+    assert all(isinstance(e, ValueError) and str(e) == "upstream broke" for e in errors)
+    assert key not in app._inflight
+    assert app.cache_get(key) is None
+    assert not os.path.exists(app._result_path(key, 'lock'))